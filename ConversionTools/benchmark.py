@@ -0,0 +1,326 @@
+#! /usr/bin/python3
+import argparse
+import contextlib
+import fnmatch
+import glob
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+from time import perf_counter, time, ctime
+from colorama import Fore, Style
+from generate import Webscrape, PageCache, Store, Manifest, Builder, Navigraph, ValidateXml, EuroScope
+from kml import Kml
+import convertGeoJson
+
+class Benchmark:
+    '''Class to time every scrape, parse and build stage against recorded inputs so runs can be compared'''
+
+    # eAIP pages recorded as fixtures, the AD-2 page for every aerodrome in AD-0.1 is recorded as well
+    pages = ["AD-0.1", "ENR-1.6", "ENR-2.1", "ENR-3.1", "ENR-3.3", "ENR-3.5", "ENR-4.1", "ENR-4.4", "ENR-5.1"]
+    # everything the build reads, copied into the scratch directory the benchmark runs in
+    inputs = ["Dataframes", "Navigraph", "Validation", "KML"]
+
+    def __init__(self, fixtureDir="Benchmarks/Fixtures", repeat=3, jobs=1, quiet=True):
+        self.fixtureDir = os.path.abspath(fixtureDir)
+        self.repeat = repeat
+        self.jobs = jobs
+        self.quiet = quiet
+        self.home = os.getcwd()
+        self.workDir = None
+        self.devnull = None # one for the whole run, alive_progress keeps writing to the first stdout it sees
+        self.results = {}
+
+    @staticmethod
+    def uri(country, page):
+        return country + "-" + page + "-en-GB.html"
+
+    def record(self):
+        # Download the fixture pages through the page cache, the same way a scrape would
+        scrape = Webscrape(cacheDir=self.fixtureDir)
+        scrape.fetchPages([self.uri(scrape.country, page) for page in self.pages])
+        dfAd01 = scrape.parseAd01Data()
+        scrape.fetchPages([self.uri(scrape.country, "AD-2." + icao) for icao in dfAd01['icao_designator']])
+        with open(os.path.join(self.fixtureDir, "fixtures.json"), "w") as f:
+            json.dump({'cycle': str(scrape.cycleDate), 'recorded': ctime(time()), 'aerodromes': dfAd01['icao_designator'].tolist()}, f, indent=2)
+        print(Fore.GREEN + "Recorded fixtures for the " + str(scrape.cycleDate) + " cycle in " + self.fixtureDir + Style.RESET_ALL)
+
+    def replay(self):
+        # A webscraper that only reads the recorded pages, or None if nothing has been recorded
+        fixtureFile = os.path.join(self.fixtureDir, "fixtures.json")
+        if not os.path.exists(fixtureFile):
+            return None
+        with open(fixtureFile) as f:
+            fixtures = json.load(f)
+        scrape = Webscrape(cacheDir=self.fixtureDir, offline=1, jobs=self.jobs)
+        scrape.cache = PageCache(fixtures['cycle'], self.fixtureDir, 1)
+        return scrape
+
+    @contextlib.contextmanager
+    def scratch(self):
+        # Run in an empty directory so the benchmark never touches Build, the inputs are copied rather than linked
+        # because Store writes feather files into Dataframes and Navigraph writes its pickled index next to the procedures
+        self.workDir = tempfile.mkdtemp(prefix="benchmark-")
+        for name in self.inputs:
+            source = os.path.join(self.home, name)
+            if os.path.isdir(source):
+                shutil.copytree(source, os.path.join(self.workDir, name))
+            elif os.path.exists(source):
+                shutil.copy2(source, os.path.join(self.workDir, name))
+        os.makedirs(os.path.join(self.workDir, "Build", "Maps"))
+        os.chdir(self.workDir)
+        try:
+            yield
+        finally:
+            os.chdir(self.home)
+            shutil.rmtree(self.workDir)
+
+    def output(self):
+        # The stages print progress bars and a line per item, which would swamp the results
+        if self.quiet and self.devnull and not self.devnull.closed:
+            return contextlib.redirect_stdout(self.devnull)
+        return contextlib.nullcontext()
+
+    def time(self, name, run, setup=None):
+        # One untimed warm up, then the best and median of repeat timed runs, setup is never timed
+        try:
+            times = []
+            for i in range(self.repeat + 1):
+                with self.output():
+                    args = setup() if setup else ()
+                    start = perf_counter()
+                    run(*args)
+                    elapsed = perf_counter() - start
+                if i:
+                    times.append(elapsed)
+            self.results[name] = {'median': statistics.median(times), 'min': min(times), 'repeat': self.repeat}
+            print("  " + name + ": " + "{:.4f}".format(self.results[name]['median']) + "s")
+        except Exception as error:
+            self.results[name] = {'error': type(error).__name__ + ": " + str(error)}
+            print(Fore.RED + "  " + name + ": " + self.results[name]['error'] + Style.RESET_ALL)
+
+    def skip(self, name, reason):
+        self.results[name] = {'skipped': reason}
+        print(Fore.YELLOW + "  " + name + ": skipped, " + reason + Style.RESET_ALL)
+
+    def scrapeStages(self):
+        # (name, run, setup) for each Webscrape.parse* method, every page is loaded before the clock starts
+        scrape = self.replay()
+        if scrape is None:
+            return None
+
+        def pages(*names):
+            def setup():
+                for name in names:
+                    scrape.pages[self.uri(scrape.country, name)] = scrape.getPage(self.uri(scrape.country, name))
+                return ()
+            return setup
+
+        with self.output():
+            pages("AD-0.1")()
+            dfAd01 = scrape.parseAd01Data()
+        aerodromes = ["AD-2." + icao for icao in dfAd01['icao_designator']]
+
+        def ad02():
+            pages(*aerodromes)()
+            return (dfAd01.copy(),)
+
+        return [
+            ("Webscrape.parseAd01Data", scrape.parseAd01Data, pages("AD-0.1")),
+            ("Webscrape.parseAd02Data", scrape.parseAd02Data, ad02),
+            ("Webscrape.parseEnr016Data", lambda: scrape.parseEnr016Data(dfAd01), pages("ENR-1.6")),
+            ("Webscrape.parseEnr02Data", scrape.parseEnr02Data, pages("ENR-2.1")),
+            ("Webscrape.parseEnr03Data(1)", lambda: scrape.parseEnr03Data('1'), pages("ENR-3.1")),
+            ("Webscrape.parseEnr03Data(3)", lambda: scrape.parseEnr03Data('3'), pages("ENR-3.3")),
+            ("Webscrape.parseEnr03Data(5)", lambda: scrape.parseEnr03Data('5'), pages("ENR-3.5")),
+            ("Webscrape.parseEnr04Data(1)", lambda: scrape.parseEnr04Data('1'), pages("ENR-4.1")),
+            ("Webscrape.parseEnr04Data(4)", lambda: scrape.parseEnr04Data('4'), pages("ENR-4.4")),
+            ("Webscrape.parseEnr051Data", scrape.parseEnr051Data, pages("ENR-5.1")),
+        ]
+
+    def buildStages(self):
+        # (name, run, setup) for each Builder.build* method, every run starts from an empty manifest so nothing is skipped
+        with self.output():
+            builder = Builder(1, jobs=self.jobs)
+            builder.frameDigests = [Manifest.frameDigest(df) for df in builder.scrape]
+
+        def fresh():
+            builder.manifest = Manifest()
+            return ()
+
+        def clean():
+            shutil.rmtree("Build")
+            os.makedirs("Build/Maps")
+            return fresh()
+
+        runwaysByIcao = {}
+        for rwy in builder.scrape[1].to_dict('records'):
+            runwaysByIcao.setdefault(rwy['icao_designator'], []).append(rwy)
+
+        def aerodromes():
+            fresh()
+            dfAd01 = builder.scrape[0]
+            synthetic = Builder.buildSyntheticThresholds(runwaysByIcao)
+            tasks = []
+            for row in dfAd01.loc[dfAd01['verified'] == 1].to_dict('records'):
+                icao = row['icao_designator']
+                tasks.append((row, runwaysByIcao.get(icao, []), {t['runway']: t['position'] for t in synthetic if t['icao_designator'] == icao}, {}))
+            return (tasks,)
+
+        stages = [
+            ("Builder.buildAirspaceXml", builder.buildAirspaceXml, fresh),
+            ("Builder.buildMapsAllAirportsXml", builder.buildMapsAllAirportsXml, fresh),
+            ("Builder.buildMapsAllNavaidsXml", builder.buildMapsAllNavaidsXml, fresh),
+            ("Builder.buildOtherTopLevelMaps", lambda: builder.buildOtherTopLevelMaps('ALL_CTA', '2'), fresh),
+            ("Builder.buildSectors", builder.buildSectors, fresh),
+            ("Builder.buildRestrictedAreas", builder.buildRestrictedAreas, fresh),
+            ("Builder.buildPositions", builder.buildPositions, fresh),
+            ("Builder.buildSyntheticThresholds", lambda: Builder.buildSyntheticThresholds(runwaysByIcao), None),
+        ]
+        if os.path.exists("Navigraph/sids.txt") and os.path.exists("Navigraph/stars.txt"):
+            stages.append(("Builder.buildAerodrome", lambda tasks: list(builder.mapAerodromes(tasks)), aerodromes))
+            stages.append(("Builder.run", builder.run, clean))
+        return stages
+
+    def navigraphStages(self):
+        if not (os.path.exists("Navigraph/sids.txt") and os.path.exists("Navigraph/stars.txt")):
+            return None
+        lookups = [(rwy['icao_designator'], rwy['runway']) for rwy in Store().read('Ad02-Runways').to_dict('records')]
+
+        def sidStar():
+            for icao, runway in lookups:
+                Navigraph.sidStar("Navigraph/sids.txt", icao, runway)
+                Navigraph.sidStar("Navigraph/stars.txt", icao, runway)
+
+        return [
+            ("Navigraph.parse", lambda: (Navigraph.parse("Navigraph/sids.txt"), Navigraph.parse("Navigraph/stars.txt")), None),
+            ("Navigraph.sidStar", sidStar, None),
+        ]
+
+    def converterStages(self, geojson=None):
+        stages = []
+        for fileIn in sorted(glob.glob("KML/*.kml")):
+            name = os.path.basename(fileIn)
+            stages.append(("Kml.placemarks(" + name + ")", lambda fileIn=fileIn: sum(1 for placemark in Kml.placemarks(fileIn)), None))
+            icao = os.path.splitext(name)[0]
+            if icao in Store().read('Ad01', columns=['icao_designator'])['icao_designator'].tolist():
+                stages.append(("EuroScope.kmlMappingConvert(" + name + ")", lambda fileIn=fileIn, icao=icao: EuroScope(icao).kmlMappingConvert(fileIn, 2), None))
+        if geojson:
+            def convert():
+                with open(os.devnull, "w") as out:
+                    convertGeoJson.convertFile(geojson, [(out, "UK_COASTLINE", tolerance) for suffix, tolerance in convertGeoJson.Simplify.levels])
+            stages.append(("convertGeoJson.convertFile", convert, None))
+        return stages
+
+    def run(self, match="*", geojson=None):
+        if geojson:
+            geojson = os.path.abspath(geojson)
+        with self.scratch(), open(os.devnull, "w") as self.devnull:
+            groups = [
+                ("Scrape", self.scrapeStages, "no fixtures recorded in " + self.fixtureDir + ", run with --record first"),
+                ("Build", self.buildStages, None),
+                ("Navigraph", self.navigraphStages, "no Navigraph procedure files"),
+                ("Convert", lambda: self.converterStages(geojson), None),
+            ]
+            for group, stages, reason in groups:
+                print(group + " stages")
+                found = stages()
+                if found is None:
+                    self.skip(group, reason)
+                    continue
+                for name, run, setup in found:
+                    if fnmatch.fnmatch(name, match):
+                        self.time(name, run, setup)
+
+            # validate whatever the build stages have left behind
+            if fnmatch.fnmatch("ValidateXml.run", match):
+                print("Validation stages")
+                files = glob.glob("Build/**/*.xml", recursive=True)
+                if files:
+                    self.time("ValidateXml.run", lambda: ValidateXml.run(self.jobs))
+                else:
+                    self.skip("ValidateXml.run", "nothing has been built to validate")
+        return self.results
+
+    @staticmethod
+    def compare(results, baseline, tolerance=0.25, match="*"):
+        # Prints every stage against the baseline and returns the names of the ones that have slowed down
+        # and of the ones that failed, i.e. raised an error or were timed in the baseline but not this time
+        slower = []
+        failed = []
+        print("\n{:<45}{:>12}{:>12}{:>9}".format("Stage", "Baseline", "Now", "Change"))
+        for name, result in sorted(results.items(), key=lambda item: -item[1].get('median', 0)):
+            before = baseline.get(name, {}).get('median')
+            if 'error' in result:
+                failed.append(name)
+                print(Fore.RED + "{:<45}{:>12}{:>12}{:>9}".format(name, "-" if before is None else "{:.4f}".format(before), "error", "") + Style.RESET_ALL)
+                continue
+            if 'median' not in result:
+                print("{:<45}{:>12}{:>12}{:>9}".format(name, "", "-", ""))
+                continue
+            if before is None:
+                print("{:<45}{:>12}{:>12.4f}{:>9}".format(name, "-", result['median'], "new"))
+                continue
+            change = result['median'] / before - 1 if before else 0
+            line = "{:<45}{:>12.4f}{:>12.4f}{:>+8.0%}".format(name, before, result['median'], change)
+            if change > tolerance:
+                slower.append(name)
+                print(Fore.RED + line + Style.RESET_ALL)
+            elif change < -tolerance:
+                print(Fore.GREEN + line + Style.RESET_ALL)
+            else:
+                print(line)
+
+        # a stage that used to be timed but wasn't this time, e.g. its group was skipped, counts as broken
+        for name, result in sorted(baseline.items()):
+            if 'median' in result and fnmatch.fnmatch(name, match) and 'median' not in results.get(name, {}) and name not in failed:
+                failed.append(name)
+                print(Fore.RED + "{:<45}{:>12.4f}{:>12}{:>9}".format(name, result['median'], "missing", "") + Style.RESET_ALL)
+        return slower, failed
+
+if __name__ == '__main__':
+    # Build command line argument parser
+    cmdParse = argparse.ArgumentParser(description="Times every scrape, parse and build stage of generate.py against recorded inputs and compares the results with a stored baseline.")
+    cmdParse.add_argument('--record', help='download the eAIP fixture pages for the current AIRAC cycle', action='store_true')
+    cmdParse.add_argument('--fixtures', help='directory the eAIP fixture pages are kept in', default='Benchmarks/Fixtures')
+    cmdParse.add_argument('--baseline', help='results to compare against', default='Benchmarks/baseline.json')
+    cmdParse.add_argument('--save', help='store these results as the new baseline', action='store_true')
+    cmdParse.add_argument('-o', '--output', help='also write these results to a json file')
+    cmdParse.add_argument('-r', '--repeat', help='number of timed runs of each stage', type=int, default=3)
+    cmdParse.add_argument('-t', '--tolerance', help='fraction a stage may slow down by before it counts as a regression', type=float, default=0.25)
+    cmdParse.add_argument('-k', '--stage', help='only run the stages matching this pattern, e.g. "Builder.*"', default='*')
+    cmdParse.add_argument('-g', '--geojson', help='geojson file to time convertGeoJson with')
+    cmdParse.add_argument('-j', '--jobs', help='number of processes for the stages that use them', type=int, default=1)
+    cmdParse.add_argument('-v', '--verbose', help='show the output of every stage', action='store_true')
+    args = cmdParse.parse_args()
+
+    bench = Benchmark(args.fixtures, args.repeat, args.jobs, not args.verbose)
+    if args.record:
+        bench.record()
+        sys.exit(0)
+
+    results = bench.run(args.stage, args.geojson)
+    report = {'generated': ctime(time()), 'repeat': args.repeat, 'jobs': args.jobs, 'stages': results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)['stages']
+    slower, failed = Benchmark.compare(results, baseline, args.tolerance, args.stage)
+
+    if args.save:
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(Fore.GREEN + "Baseline saved to " + args.baseline + Style.RESET_ALL)
+    elif slower:
+        print(Fore.RED + str(len(slower)) + " stage(s) slower than the baseline by more than " + "{:.0%}".format(args.tolerance) + Style.RESET_ALL)
+    if failed:
+        print(Fore.RED + str(len(failed)) + " stage(s) failed or are missing: " + ", ".join(failed) + Style.RESET_ALL)
+    if failed or (slower and not args.save):
+        sys.exit(1)
@@ -1,70 +1,122 @@
 #! /usr/bin/python3
 import json
-import dicttoxml
-import xml.etree.ElementTree as xtree
 import argparse
 import re
-from bs4 import BeautifulSoup
+import os
+import sys
+import numpy as np
 from time import time, ctime
 from defusedxml import defuse_stdlib
+from coordinates import Dms
+from simplify import Simplify
 
 defuse_stdlib()
 
-# Build command line argument parser
-cmdParse = argparse.ArgumentParser(description="Application to convert a geojson file into xml for vatSys. Tip: use https://mapshaper.org/ to simplify the file first.")
-cmdParse.add_argument('-p', '--print', help='print the xml file to screen')
-cmdParse.add_argument('-c', '--convert', help='carry out the initial geoson to xml conversion')
-args = cmdParse.parse_args()
+featuresArray = re.compile(r'"features"\s*:\s*\[')
 
-def convertFile(fileIn, fileOut):
+def iterFeatures(fileIn, chunkSize=1 << 16):
+    # Yields one GeoJSON feature at a time so only the feature being converted is held in memory
+    decoder = json.JSONDecoder()
     with open(fileIn, 'r') as f:
-        data = json.loads(f.read())
-        xml = dicttoxml.dicttoxml(data)
-        with open(fileOut, 'w') as w:
-            string = str(xml)
-            w.write(string)
-        w.close()
+        buffer = f.read(chunkSize)
+        match = featuresArray.search(buffer)
+        while match is None:
+            chunk = f.read(chunkSize)
+            if not chunk:
+                # not a FeatureCollection, so the file is a single feature or geometry
+                data = json.loads(buffer)
+                if data.get('type') == 'Feature':
+                    yield data
+                else:
+                    yield {'type': 'Feature', 'geometry': data}
+                return
+            buffer += chunk
+            match = featuresArray.search(buffer)
 
+        buffer = buffer[match.end():]
+        while True:
+            buffer = buffer.lstrip().lstrip(',').lstrip()
+            if buffer.startswith(']'):
+                return
+            try:
+                feature, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                # the feature runs past the end of the buffer, read at least as much again so large features stay linear
+                chunk = f.read(max(chunkSize, len(buffer)))
+                if not chunk:
+                    raise
+                buffer += chunk
+                continue
+            yield feature
+            buffer = buffer[end:]
 
-if args.convert:
-    file = args.convert
-    convertFile(file, 'OUTPUT.xml')
-elif args.print:
-    file = args.print
-    # Define the XML root tag
-    xml = xtree.Element("Maps")
-    xml.set('xmlns:xsd', 'http://www.w3.org/2001/XMLSchema')
-    xml.set('xmlns:xsi', 'http://www.w3.org/2001/XMLSchema-instance')
+def iterLines(geometry):
+    # Every line or ring in a geometry, as a list of [lon, lat(, alt)] positions
+    kind = geometry['type']
+    if kind == 'LineString':
+        yield geometry['coordinates']
+    elif kind in ('MultiLineString', 'Polygon'):
+        yield from geometry['coordinates']
+    elif kind == 'MultiPolygon':
+        for polygon in geometry['coordinates']:
+            yield from polygon
+    elif kind == 'GeometryCollection':
+        for part in geometry['geometries']:
+            yield from iterLines(part)
 
-    # Set a tag for XML generation time
-    xml.set('generated', ctime(time()))
+def convertFile(fileIn, levels):
+    # Writes every level of detail as it goes, one Line per line or ring in the GeoJSON
+    # levels is a list of (open file, map name, tolerance in metres)
+    for out, mapName, tolerance in levels:
+        out.write('<?xml version="1.0" ?>\n')
+        out.write('<Maps xmlns:xsd="http://www.w3.org/2001/XMLSchema" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" generated="' + ctime(time()) + '">\n')
+        out.write('   <Map Type="System" Name="' + mapName + '" Priority="3">\n')
 
-    xmlMap = xtree.SubElement(xml, 'Map')
-    xmlMap.set('Type', 'System')
-    xmlMap.set('Name', 'UK_COASTLINE')
-    xmlMap.set('Priority', '3')
+    vertices = [0] * len(levels)
+    for feature in iterFeatures(fileIn):
+        if not feature.get('geometry'):
+            continue
+        for line in iterLines(feature['geometry']):
+            if len(line) < 2:
+                continue
+            points = np.array([position[:2] for position in line], dtype=float)
+            for i, (out, mapName, tolerance) in enumerate(levels):
+                lat, lon = Simplify.points(points[:, 1], points[:, 0], tolerance)
+                out.write('      <Line Name="Coastline">' + '/'.join(Dms.format(lat, lon, 3)) + '</Line>\n')
+                vertices[i] += len(lat)
 
-    with open(file, 'r') as f:
-        data = f.read()
+    for out, mapName, tolerance in levels:
+        out.write('   </Map>\n')
+        out.write('</Maps>\n')
+    return vertices
 
-    bs_data = BeautifulSoup(data, "lxml")
+if __name__ == '__main__':
+    # Build command line argument parser
+    cmdParse = argparse.ArgumentParser(description="Application to convert a geojson file into xml for vatSys. Lines are simplified to each level of detail on the way through.")
+    cmdParse.add_argument('-p', '--print', help='print the xml file to screen')
+    cmdParse.add_argument('-c', '--convert', help='convert a geojson file into a vatSys map')
+    cmdParse.add_argument('-o', '--output', help='where to write the converted map, each level of detail adds its suffix to the name', default='Build/Maps/UK_COAST.xml')
+    cmdParse.add_argument('-n', '--name', help='name of the map', default='UK_COASTLINE')
+    cmdParse.add_argument('-l', '--level', help='level of detail to write as a suffix and a tolerance in metres, e.g. -l _HI 25 (repeatable)', nargs=2, action='append', metavar=('SUFFIX', 'METRES'))
+    args = cmdParse.parse_args()
 
-    for tag in bs_data.find_all('coordinates'):
-        xmlLine = xtree.SubElement(xmlMap, 'Line')
-        xmlLine.set('Name', 'Coastline')
-        coords = re.finditer(r'(\<item type\=\"float\"\>)([\+|\-])([0-9]{1}\.[0-9]{4})([0-9]{11})(\<\/item\><item type\=\"float\"\>)([0-9]{2}\.)([0-9]{4})([0-9]{10})', str(tag))
+    levels = Simplify.levels
+    if args.level:
+        levels = [(suffix, float(tolerance)) for suffix, tolerance in args.level]
 
-        output = ''
-        for c in coords:
-            #print(c)
-            formatted = "+" + c.group(6) + c.group(7) + c.group(2) + "00" + c.group(3) + "/\n"
-            #print(formatted)
-            output += str(formatted)
-
-        xmlLine.text = output
-    treeOut = xtree.ElementTree(xml)
-    treeOut.write('Build/Maps/UK_COAST.xml', encoding="utf-8", xml_declaration=True)
-
-else:
-    print("Nothing to do here\n")
-    cmdParse.print_help()
+    if args.convert:
+        base, extension = os.path.splitext(args.output)
+        outputs = [open(base + suffix + extension, 'w') for suffix, tolerance in levels]
+        try:
+            vertices = convertFile(args.convert, [(out, args.name + suffix, tolerance) for out, (suffix, tolerance) in zip(outputs, levels)])
+        finally:
+            for out in outputs:
+                out.close()
+        for out, count, (suffix, tolerance) in zip(outputs, vertices, levels):
+            print(out.name + ": " + str(count) + " vertices at " + str(tolerance) + "m")
+    elif args.print:
+        suffix, tolerance = levels[0]
+        convertFile(args.print, [(sys.stdout, args.name + suffix, tolerance)])
+    else:
+        print("Nothing to do here\n")
+        cmdParse.print_help()
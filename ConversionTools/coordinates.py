@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+import re
+import numpy as np
+
+class Dms:
+    '''Class to convert whole arrays of coordinates between decimal degrees and the vatSys formats'''
+
+    # +DDMMSS.ss+DDDMMSS.ss as per https://virtualairtrafficsystem.com/docs/dpk/#lat-long-format
+    vatsys = re.compile(r'([+-])(\d{2})(\d{2})(\d{2}(?:\.\d+)?)([+-])(\d{3})(\d{2})(\d{2}(?:\.\d+)?)')
+
+    @staticmethod
+    def signs(hemispheres): # Turns an array of compass points or +/- into 1 or -1
+        return np.where(np.isin(np.asarray(hemispheres), ['S', 'W', '-']), -1.0, 1.0)
+
+    @staticmethod
+    def fromParts(hemispheres, degrees, minutes, seconds):
+        # degrees, minutes and seconds may be strings or numbers
+        degrees = np.asarray(degrees, dtype=float)
+        minutes = np.asarray(minutes, dtype=float)
+        seconds = np.asarray(seconds, dtype=float)
+        return Dms.signs(hemispheres) * (degrees + minutes / 60 + seconds / 3600)
+
+    @staticmethod
+    def fromCompass(values, hemispheres):
+        # AIP style DDMMSS(.ss) or DDDMMSS(.ss) with a separate N/S/E/W
+        values = np.asarray(values, dtype=float)
+        degrees, rest = np.divmod(values, 10000)
+        minutes, seconds = np.divmod(rest, 100)
+        return Dms.signs(hemispheres) * (degrees + minutes / 60 + seconds / 3600)
+
+    @staticmethod
+    def parse(text):
+        # Reads a / separated string (or list of strings) of vatSys coordinates and returns lat and lon arrays
+        # A vertex that can't be read raises ValueError, dropping it would leave the points after it paired up wrongly
+        if not isinstance(text, str):
+            text = '/'.join(text)
+        parts = []
+        for vertex in text.split('/'):
+            vertex = vertex.strip()
+            if not vertex:
+                continue
+            match = Dms.vatsys.fullmatch(vertex)
+            if match is None:
+                raise ValueError("Not a vatSys coordinate: " + repr(vertex))
+            parts.append(match.groups())
+        parts = np.array(parts, dtype=str).reshape(-1, 8)
+        lat = Dms.fromParts(parts[:, 0], parts[:, 1], parts[:, 2], parts[:, 3])
+        lon = Dms.fromParts(parts[:, 4], parts[:, 5], parts[:, 6], parts[:, 7])
+        return lat, lon
+
+    @staticmethod
+    def fromKml(text):
+        # KML coordinates are whitespace separated lon,lat[,alt] tuples
+        text = str(text)
+        count = len(text.split())
+        values = np.fromstring(text.replace(',', ' '), sep=' ')
+        if count and values.size % count == 0 and values.size >= 2 * count:
+            # every tuple has the same number of values, so read them all in one go
+            points = values.reshape(count, -1)
+        else:
+            tuples = [t.split(',') for t in text.split()]
+            points = np.array([t[:2] for t in tuples if len(t) >= 2], dtype=float).reshape(-1, 2)
+        return points[:, 1], points[:, 0]
+
+    @staticmethod
+    def split(values, places):
+        # Rounds to the nearest 1/10^places of a second before splitting so 59.999 carries into the minute
+        values = np.asarray(values, dtype=float)
+        scale = 10 ** places
+        total = np.rint(np.abs(values) * 3600 * scale).astype(np.int64)
+        degrees, rest = np.divmod(total, 3600 * scale)
+        minutes, rest = np.divmod(rest, 60 * scale)
+        seconds, fraction = np.divmod(rest, scale)
+        signs = np.where(values < 0, '-', '+')
+        return zip(signs.tolist(), degrees.tolist(), minutes.tolist(), seconds.tolist(), fraction.tolist())
+
+    @staticmethod
+    def formatAxis(values, width, places):
+        if places:
+            template = '{}{:0' + str(width) + 'd}{:02d}{:02d}.{:0' + str(places) + 'd}'
+        else:
+            template = '{}{:0' + str(width) + 'd}{:02d}{:02d}'
+        return [template.format(s, d, m, sec, f) for s, d, m, sec, f in Dms.split(values, places)]
+
+    @staticmethod
+    def format(lat, lon, places=2): # returns a list of +DDMMSS.ss+DDDMMSS.ss strings
+        return [a + b for a, b in zip(Dms.formatAxis(lat, 2, places), Dms.formatAxis(lon, 3, places))]
+
+    @staticmethod
+    def formatDecimalAxis(values, width, places):
+        values = np.asarray(values, dtype=float)
+        scale = 10 ** places
+        whole, fraction = np.divmod(np.rint(np.abs(values) * scale).astype(np.int64), scale)
+        signs = np.where(values < 0, '-', '+')
+        template = '{}{:0' + str(width) + 'd}.{:0' + str(places) + 'd}'
+        return [template.format(s, w, f) for s, w, f in zip(signs.tolist(), whole.tolist(), fraction.tolist())]
+
+    @staticmethod
+    def formatDecimal(lat, lon, places=10): # returns a list of +DD.dddd+DDD.dddd strings
+        return [a + b for a, b in zip(Dms.formatDecimalAxis(lat, 2, places), Dms.formatDecimalAxis(lon, 3, places))]
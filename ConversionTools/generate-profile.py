@@ -6,7 +6,6 @@ import os
 import fnmatch
 import xml.etree.ElementTree as xtree
 import pandas as pd
-import urllib3
 import mysql.connector
 import mysqlconnect # mysql connection details
 import xmlschema
@@ -23,6 +22,7 @@ from shapely.geometry import MultiPoint
 # This file generates XML files for VATSys from the UK NATS AIRAC
 defuse_stdlib()
 cursor = mysqlconnect.db.cursor()
+session = requests.Session() # shared keep-alive session for every page request
 
 # Build command line argument parser
 cmdParse = argparse.ArgumentParser(description="Application to collect data from an AIRAC source and build that into xml files for use with vatSys.")
@@ -49,12 +49,10 @@ class Airac:
         # Webscrape the specified page for AIRAC dataset
         address = Airac.getUrl() + uri
 
-        http = urllib3.PoolManager()
-        error = http.request("GET", address)
-        if (error.status == 404):
+        page = session.get(address)
+        if (page.status_code == 404):
             return 404
 
-        page = requests.get(address)
         return BeautifulSoup(page.content, "lxml")
 
     def enr41(table):
@@ -768,12 +766,10 @@ class WebScrape:
     def parseUKMil():
         # this is a hard-coded bodge for getting UK military ICAO designators.
         url = "https://www.aidu.mod.uk/aip/aipVolumes.htm"
-        http = urllib3.PoolManager()
-        error = http.request("GET", url)
-        if (error.status == 404):
+        page = session.get(url)
+        if (page.status_code == 404):
             return 404
 
-        page = requests.get(url)
         source = BeautifulSoup(page.content, "lxml")
         getICAO = re.findall(r'(?<=\")([L|E|F]{1}[A-Z]{3})(?=\")', source) # L, E and F are to include British Overseas Territory listed here
 
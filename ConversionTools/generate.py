@@ -2,33 +2,48 @@
 import math
 import datetime
 import argparse
+import atexit
 import zipfile
 import shutil
-import urllib3
 import argparse
 import requests
 import re
 import os
 import fnmatch
+import sys
+import threading
+import queue
+import multiprocessing
+import hashlib
+import inspect
+import json
+import pickle
+import tempfile
+import traceback
 import xml.etree.ElementTree as xtree
 import pandas as pd
-import urllib3
+import numpy as np
 import xmlschema
+import pyarrow as pa
+import pyarrow.feather as feather
 import pyproj
 from datetime import date
 from defusedxml import defuse_stdlib
 from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from colorama import Fore, Style
-from time import time, ctime
+from time import time, ctime, sleep, monotonic
 from alive_progress import alive_bar
 from pykml import parser
-from shapely.geometry import MultiPoint
-from shapely.geometry import Point as sPoint
-from shapely.ops import transform
-from functools import partial
-from geopy.point import Point
-from geopy.distance import geodesic
-from xml.dom import minidom
+from functools import lru_cache
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future, wait, FIRST_COMPLETED
+from urllib.parse import urlsplit
+from coordinates import Dms
+from kml import Kml
+from instrument import Stage, Metrics, Memory
+from simplify import Simplify
 
 class Airac:
     '''Class for general functions relating to AIRAC'''
@@ -77,128 +92,653 @@ class Airac:
         basePostString = "-AIRAC/html/eAIP/"
         return baseUrl + str(baseDate) + basePostString
 
+class PageCache:
+    '''Class to keep a local copy of the eAIP pages for each AIRAC cycle'''
+
+    cacheable = (200, 404) # anything else, e.g. 403, 429 or 5xx, may be different next time
+
+    def __init__(self, cycleDate, cacheDir="Cache", offline=0):
+        # Page contents are stored once by hash and shared between cycles, each cycle has its own index of uri to content
+        self.objectDir = os.path.join(cacheDir, "objects")
+        self.indexDir = os.path.join(cacheDir, str(cycleDate))
+        self.offline = offline
+        os.makedirs(self.objectDir, exist_ok=True)
+        os.makedirs(self.indexDir, exist_ok=True)
+
+    @staticmethod
+    def digest(data):
+        return hashlib.sha256(data).hexdigest()
+
+    def lookup(self, uri):
+        # Return the index entry for the given page or None if it has never been downloaded this cycle
+        indexFile = os.path.join(self.indexDir, self.digest(uri.encode()) + ".json")
+        if not os.path.exists(indexFile):
+            return None
+        with open(indexFile, "r") as f:
+            entry = json.load(f)
+        if entry['status'] not in self.cacheable:
+            return None # an error page saved by an older version, fetch it again
+        return entry
+
+    def content(self, entry):
+        # Return the cached page content for an index entry
+        if entry['status'] == 404:
+            return 404
+        with open(os.path.join(self.objectDir, entry['content']), "rb") as f:
+            return f.read()
+
+    @staticmethod
+    def replace(path, data):
+        # Write through a temporary file of its own, threads storing the same page at once would trip over a shared one
+        fd, tmpFile = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmpFile, path)
+        finally:
+            if os.path.exists(tmpFile):
+                os.remove(tmpFile)
+
+    def store(self, uri, status, headers, content):
+        # Save a downloaded page along with the validators needed to revalidate it later
+        entry = {'uri': uri, 'status': status, 'etag': headers.get('ETag'), 'last_modified': headers.get('Last-Modified'), 'content': None}
+        if status != 404:
+            entry['content'] = self.digest(content)
+            objectFile = os.path.join(self.objectDir, entry['content'])
+            if not os.path.exists(objectFile):
+                self.replace(objectFile, content)
+
+        indexFile = os.path.join(self.indexDir, self.digest(uri.encode()) + ".json")
+        self.replace(indexFile, json.dumps(entry).encode())
+
+class Accumulator:
+    '''Class to collect dataframe rows column by column and build the dataframe once at the end'''
+
+    def __init__(self, columns, dtypes=None):
+        self.columns = {column: [] for column in columns}
+        self.dtypes = dtypes or {}
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()), []))
+
+    def append(self, row):
+        # Add a single row given as a dict of column: value
+        for column, values in self.columns.items():
+            values.append(row[column])
+        Metrics.count('rows_parsed')
+
+    def frame(self):
+        df = pd.DataFrame(self.columns)
+        if self.dtypes:
+            df = df.astype(self.dtypes)
+        return df
+
+class Store:
+    '''Class to keep the scraped AIRAC tables as typed Feather files, one per table'''
+
+    # Explicit schema for every table, in the order the Builder indexes them
+    tables = {
+        'Ad01': pa.schema([('icao_designator', pa.string()), ('verified', pa.int64()), ('location', pa.string()), ('elevation', pa.int64()), ('name', pa.string()), ('magnetic_variation', pa.float64())]),
+        'Ad02-Runways': pa.schema([('icao_designator', pa.string()), ('runway', pa.string()), ('location', pa.string()), ('elevation', pa.int64()), ('bearing', pa.float64()), ('length', pa.int64())]),
+        'Ad02-Services': pa.schema([('icao_designator', pa.string()), ('callsign_type', pa.string()), ('frequency', pa.float64())]),
+        'Enr016': pa.schema([('start', pa.string()), ('end', pa.string()), ('depart', pa.string()), ('arrive', pa.string()), ('string', pa.string())]),
+        'Enr02-FIR': pa.schema([('name', pa.string()), ('callsign', pa.string()), ('frequency', pa.float64()), ('boundary', pa.string()), ('upper_fl', pa.int64()), ('lower_fl', pa.int64())]),
+        'Enr02-UIR': pa.schema([('name', pa.string()), ('callsign', pa.string()), ('frequency', pa.float64()), ('boundary', pa.string()), ('upper_fl', pa.int64()), ('lower_fl', pa.int64())]),
+        'Enr02-CTA': pa.schema([('fir_id', pa.int64()), ('name', pa.string()), ('boundary', pa.string())]),
+        'Enr02-TMA': pa.schema([('fir_id', pa.int64()), ('name', pa.string()), ('boundary', pa.string())]),
+        'Enr031': pa.schema([('name', pa.string()), ('route', pa.string())]),
+        'Enr033': pa.schema([('name', pa.string()), ('route', pa.string())]),
+        'Enr035': pa.schema([('name', pa.string()), ('route', pa.string())]),
+        'Enr041': pa.schema([('name', pa.string()), ('type', pa.string()), ('coords', pa.string())]),
+        'Enr044': pa.schema([('name', pa.string()), ('type', pa.string()), ('coords', pa.string())]),
+        'Enr051': pa.schema([('name', pa.string()), ('boundary', pa.string()), ('floor', pa.int64()), ('ceiling', pa.int64())]),
+    }
+
+    def __init__(self, storeDir="Dataframes"):
+        self.storeDir = storeDir
+        self.frames = {} # tables that have been loaded in full, loaded the first time they are asked for
+
+    def path(self, name, extension=".feather"):
+        return os.path.join(self.storeDir, name + extension)
+
+    def __len__(self):
+        return len(self.tables)
+
+    def __getitem__(self, i):
+        # Tables can still be picked out by position like the old list of dataframes
+        name = list(self.tables)[i]
+        if name not in self.frames:
+            self.frames[name] = self.read(name)
+        return self.frames[name]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    @Stage.timed
+    def read(self, name, columns=None):
+        featherFile = self.path(name)
+        csvFile = self.path(name, ".csv")
+        if os.path.exists(csvFile) and (not os.path.exists(featherFile) or os.path.getmtime(csvFile) > os.path.getmtime(featherFile)):
+            # First run from the CSVs kept in the repo, or a CSV has been edited by hand since
+            self.write(name, pd.read_csv(csvFile, index_col=0, dtype=str, keep_default_na=False), csv=False)
+        # Uncompressed so the file is memory mapped and only the columns asked for are read
+        return feather.read_table(featherFile, columns=columns, memory_map=True).to_pandas()
+
+    @Stage.timed
+    def write(self, name, df, csv=True):
+        columns = []
+        for field in self.tables[name]:
+            values = df[field.name]
+            if pa.types.is_string(field.type):
+                values = values.astype(str)
+            else:
+                values = pd.to_numeric(values)
+            columns.append(pa.array(values, from_pandas=True).cast(field.type))
+        table = pa.Table.from_arrays(columns, schema=self.tables[name])
+
+        os.makedirs(self.storeDir, exist_ok=True)
+        if csv:
+            # A readable copy for reviewing AIRAC changes in git, written first so it isn't newer than the Feather file
+            table.to_pandas().to_csv(self.path(name, ".csv"))
+        feather.write_feather(table, self.path(name), compression='uncompressed')
+        self.frames.pop(name, None)
+
+class Extractor:
+    '''Class to pull AIXM tagged values out of eAIP html in a single pass'''
+
+    def __init__(self, fields):
+        # fields maps a key to a (pattern, AIXM field name) pair, each pair is compiled once here
+        self.fields = {}
+        self.names = {}
+        for key, (find, name) in fields.items():
+            if name not in self.names:
+                self.names[name] = re.compile(">" + name)
+            self.fields[key] = (re.compile(find + r"(?=</span>)"), name)
+
+    def extract(self, node):
+        # Serialise the node once and return every tagged field found in it
+        # A value counts when it is followed by </span> with the AIXM field name later on the same line
+        lines = str(node).split("\n")
+        tagged = {name: self.tag(lines, pattern) for name, pattern in self.names.items()}
+
+        result = {}
+        for key, (pattern, name) in self.fields.items():
+            masked, lineStarts, lineGroups = tagged[name]
+            groupCount = pattern.groups + self.names[name].groups
+            values = []
+            for match in pattern.finditer(masked):
+                groups = match.groups('')
+                if self.names[name].groups:
+                    # groups in the field name come from the last occurrence of it on the line
+                    groups += lineGroups[bisect_right(lineStarts, match.end()) - 1]
+                if groupCount == 0:
+                    values.append(match.group())
+                elif groupCount == 1:
+                    values.append(groups[0])
+                else:
+                    values.append(groups)
+            result[key] = values
+        return result
+
+    @staticmethod
+    def tag(lines, namePattern):
+        # Disable every </span> that isn't followed by the field name on its own line so a plain lookahead can be used
+        maskedLines = []
+        lineStarts = []
+        lineGroups = []
+        position = 0
+        for line in lines:
+            last = None
+            for last in namePattern.finditer(line):
+                pass
+
+            if last:
+                keep = max(last.start() - 6, 0) # a </span> starting before here has the field name after it
+                lineGroups.append(last.groups(''))
+            else:
+                keep = 0
+                lineGroups.append(())
+            maskedLines.append(line[:keep] + line[keep:].replace("</span>", "\x00/span>"))
+            lineStarts.append(position)
+            position += len(line) + 1
+        return ["\n".join(maskedLines), lineStarts, lineGroups]
+
+class Scheduler:
+    '''Class to run a set of dependent stages, starting each one as soon as the stages it needs have finished'''
+
+    def __init__(self, stages, workers=4):
+        # stages maps a name to (names of the stages it needs, function called with their outputs in that order)
+        self.stages = stages
+        self.workers = workers # number of stages run at once, 1 runs them one after another in this thread
+        self.order = self.sort()
+
+    def sort(self):
+        # Every stage after the ones it needs, otherwise in the order they were given
+        order = []
+        while len(order) < len(self.stages):
+            ready = [name for name, (needs, run) in self.stages.items() if name not in order and all(need in order for need in needs)]
+            if not ready:
+                for name, (needs, run) in self.stages.items():
+                    for need in needs:
+                        if need not in self.stages:
+                            raise ValueError("Stage " + name + " needs " + need + " which doesn't exist")
+                raise ValueError("Stages " + ", ".join(name for name in self.stages if name not in order) + " depend on each other")
+            order += ready
+        return order
+
+    def call(self, name, inputs, save):
+        output = self.stages[name][1](*inputs)
+        if save:
+            save(name, output)
+        return output
+
+    @staticmethod
+    def processContext():
+        # Forked workers would inherit locks held by other threads, e.g. downloads, progress bars or the memory sampler,
+        # so process pools start their workers from a fresh interpreter
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        return multiprocessing.get_context(method)
+
+    @staticmethod
+    def inline(function, *args):
+        # A future for a call made there and then, for when there is no pool to hand it to
+        future = Future()
+        try:
+            future.set_result(function(*args))
+        except Exception as error:
+            future.set_exception(error)
+        return future
+
+    def submit(self, executor, name, inputs, save):
+        if executor:
+            return executor.submit(self.call, name, inputs, save)
+        return Scheduler.inline(self.call, name, inputs, save)
+
+    def run(self, load=None, save=None):
+        # load returns the saved output of a stage or None if it has to be run, save is given the output of every stage that is run
+        # A stage that fails only stops the stages that need it, everything else still runs and is saved
+        # Returns the output of every stage that finished and the error for every stage that didn't
+        results = {}
+        failed = {}
+        for name in self.order:
+            output = load(name) if load else None
+            if output is not None:
+                results[name] = output
+                print(Fore.GREEN + "Stage " + name + " already finished this cycle, skipping" + Style.RESET_ALL)
+
+        running = {}
+        executor = ThreadPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+        try:
+            # Stages print their own progress when they run one at a time
+            with alive_bar(len(self.order) - len(results), disable=executor is None) as bar:
+                while True:
+                    for name in self.order:
+                        if name in results or name in failed or name in running.values():
+                            continue
+                        needs = self.stages[name][0]
+                        missing = [need for need in needs if need in failed]
+                        if missing:
+                            failed[name] = RuntimeError("needs " + ", ".join(missing))
+                            print(Fore.RED + "Stage " + name + " skipped as it needs " + ", ".join(missing) + Style.RESET_ALL)
+                            bar()
+                        elif all(need in results for need in needs):
+                            running[self.submit(executor, name, [results[need] for need in needs], save)] = name
+                            if executor is None:
+                                break # it has already finished, so record it before looking for the next one
+
+                    if not running:
+                        break
+                    done, pending = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        name = running.pop(future)
+                        if future.exception():
+                            failed[name] = future.exception()
+                            print(Fore.RED + "Stage " + name + " failed" + Style.RESET_ALL)
+                            traceback.print_exception(future.exception())
+                        else:
+                            results[name] = future.result()
+                            print(Fore.GREEN + "Stage " + name + " OK" + Style.RESET_ALL)
+                        bar()
+        finally:
+            if executor:
+                executor.shutdown()
+        return results, failed
+
 class Webscrape:
     '''Class to scrape data from the given AIRAC eAIP URL'''
 
-    def __init__(self, next=0):
+    # AIXM tagged fields for each section of the eAIP
+    ad0202Fields = Extractor({'magVar': (r"([\d]{1}\.[\d]{2}).([W|E]{1})", "TAD_HP;VAL_MAG_VAR")})
+    ad0212Fields = Extractor({
+        'runway': (r"([\d]{2}[L|C|R]?)", "TRWY_DIRECTION;TXT_DESIG"),
+        'lat': (r"([\d]{6}\.[\d]{2}[N|S]{1})", "TRWY_CLINE_POINT;GEO_LAT"),
+        'lon': (r"([\d]{7}\.[\d]{2}[E|W]{1})", "TRWY_CLINE_POINT;GEO_LONG"),
+        'elevation': (r"([\d]{3})", "TRWY_CLINE_POINT;VAL_GEOID_UNDULATION"),
+        'bearing': (r"([\d]{3}\.[\d]{2}.)", "TRWY_DIRECTION;VAL_TRUE_BRG"),
+        'length': (r"([\d]{3,4})", "TRWY;VAL_LEN"),
+        })
+    ad0218Fields = Extractor({
+        'service': (r"(APPROACH|GROUND|DELIVERY|TOWER|DIRECTOR|INFORMATION)", "TCALLSIGN_DETAIL"),
+        'frequency': (r"([\d]{3}\.[\d]{3})", "TFREQUENCY"),
+        })
+    enr021Fields = Extractor({
+        'firTitle': (r"([A-Z]*\sFIR)", "TAIRSPACE;TXT_NAME"),
+        'ctaTitle': (r"([A-Z\s]*)(\sCTA\s)([\d]?)", "TAIRSPACE;TXT_NAME"),
+        'tmaTitle': (r"([A-Z\s]*)(\sTMA\s)([\d]?)", "TAIRSPACE;TXT_NAME"),
+        'space': (r"([\d]{6,7})([N|E|S|W]{1})", "TAIRSPACE_VERTEX;GEO_L"),
+        'layerUpper': (r"(?<=\>)([\d]{2,3})", "TAIRSPACE_LAYER;VAL_DIST_VER_UPPER"),
+        'layerLower': (r"(?<=\>)([\d]{2,3})", "TAIRSPACE_LAYER;VAL_DIST_VER_LOWER"),
+        'volumeUpper': (r"(?<=\>)([\d]{2,3})", "TAIRSPACE_VOLUME;VAL_DIST_VER_UPPER"),
+        'volumeLower': (r"(?<=\>)([\d]{2,3})", "TAIRSPACE_VOLUME;VAL_DIST_VER_LOWER"),
+        })
+    enr03Fields = Extractor({
+        'name': (r"([A-Z]{1,2}[\d]{1,4})", "TEN_ROUTE_RTE;TXT_DESIG"),
+        'route': (r"([A-Z]{3,5})", "T(DESIGNATED_POINT|DME|VOR|NDB);CODE_ID"),
+        })
+    enr04Fields = Extractor({
+        'lat': (r"([\d]{6})([N|S]{1})", "T"),
+        'lon': (r"([\d]{7})([E|W]{1})", "T"),
+        })
+    enr051Fields = Extractor({
+        'id': (r"((EG)\s(D|P|R)[\d]{3}[A-Z]*)", "TAIRSPACE;CODE_ID"),
+        'name': (r"([A-Z\s]*)", "TAIRSPACE;TXT_NAME"),
+        'space': (r"([\d]{6,7})([N|E|S|W]{1})", "TAIRSPACE_VERTEX;GEO_L"),
+        'upper': (r"([\d]{3,5})", "TAIRSPACE_VOLUME;VAL_DIST_VER_UPPER"),
+        #'lower': (r"([\d]{3,5})|(SFC)", "TAIRSPACE_VOLUME;VAL_DIST_VER_LOWER"),
+        })
+
+    def __init__(self, next=0, workers=8, delay=0.1, cacheDir="Cache", offline=0, stageWorkers=4, resume=0, jobs=None, timeout=30):
         cycle = Airac()
-        self.cycleUrl = cycle.url()
+        self.cycleUrl = cycle.url(next)
+        if next:
+            self.cycleDate = cycle.nextCycle()
+        else:
+            self.cycleDate = cycle.currentCycle()
         self.country = "EG"
+        self.cache = PageCache(self.cycleDate, cacheDir, offline)
+        self.workers = workers # maximum number of pages downloaded at once
+        self.delay = delay # minimum number of seconds between two requests to the same host
+        self.timeout = timeout # seconds to wait for the server to connect or send anything before trying again
+        self.pages = {} # raw page content (or 404) for every uri that has been prefetched
+        self.lastRequest = {}
+        self.requestLock = threading.Lock()
+        self.stageWorkers = stageWorkers # number of parse stages run at once
+        self.jobs = jobs # number of processes parsing the AD-2 pages, None for one per CPU
+        self.resume = resume # reuse the output of any stage that has already finished this cycle
+        self.quiet = False # progress bars can't be shown by more than one stage at a time
+
+        # One keep-alive session for the whole run so every page reuses the same TLS connections
+        # Dropped connections, timeouts and server errors are retried a few times with a growing wait in between
+        self.session = requests.Session()
+        retry = Retry(total=3, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=["GET"], raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def polite(self, address):
+        # Block until this host is allowed another request
+        host = urlsplit(address).netloc
+        with self.requestLock:
+            now = monotonic()
+            slot = max(now, self.lastRequest.get(host, 0) + self.delay)
+            self.lastRequest[host] = slot
+        sleep(slot - now)
+
+    def progress(self, total):
+        return alive_bar(total, disable=self.quiet)
+
+    @Stage.timed
+    def getPage(self, uri):
+        # Download the given page and return the raw content, or 404 if it doesn't exist
+        address = self.cycleUrl + uri
+        cached = self.cache.lookup(uri)
+
+        if self.cache.offline:
+            if cached is None:
+                print(Fore.RED + "Offline and " + uri + " is not in the cache" + Style.RESET_ALL)
+                Metrics.count('pages_missing')
+                return 404
+            Metrics.count('cache_hits')
+            return self.cache.content(cached)
+
+        # Only ask for the page if it has changed since it was cached
+        headers = {}
+        if cached:
+            if cached['etag']:
+                headers['If-None-Match'] = cached['etag']
+            if cached['last_modified']:
+                headers['If-Modified-Since'] = cached['last_modified']
+
+        self.polite(address)
+        page = self.session.get(address, headers=headers, timeout=self.timeout)
+        Metrics.count('requests')
+        if (page.status_code == 304 and cached):
+            Metrics.count('cache_hits')
+            return self.cache.content(cached)
+
+        if page.status_code not in PageCache.cacheable:
+            # not cached, so the page is asked for again next run
+            raise requests.HTTPError("HTTP " + str(page.status_code) + " for " + address, response=page)
+
+        self.cache.store(uri, page.status_code, page.headers, page.content)
+        if (page.status_code == 404):
+            Metrics.count('pages_missing')
+            return 404
+
+        Metrics.count('pages_fetched')
+        Metrics.count('bytes_downloaded', len(page.content))
 
+        return page.content
+
+    def tryPage(self, uri):
+        # Like getPage but a failed download is returned rather than raised, so one bad page doesn't stop the others
+        try:
+            return self.getPage(uri)
+        except Exception as error:
+            Metrics.count('pages_failed')
+            return error
+
+    @Stage.timed
+    def fetchPages(self, uris):
+        # Download all of the given pages through a bounded pool of workers ready for the parsers
+        # A page that fails is kept as its error, which is raised by whichever parser asks for that page
+        uris = [uri for uri in dict.fromkeys(uris) if uri not in self.pages]
+        print("Fetching " + str(len(uris)) + " pages with " + str(self.workers) + " workers...")
+        with self.progress(len(uris)) as bar: # Define the progress bar
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                for uri, content in zip(uris, executor.map(self.tryPage, uris)):
+                    if isinstance(content, Exception):
+                        print(Fore.RED + "Failed to download " + uri + ": " + str(content) + Style.RESET_ALL)
+                    self.pages[uri] = content
+                    bar()
+
+    def takePage(self, uri):
+        # Return the prefetched content of the given page, or download it if it wasn't
+        if uri in self.pages:
+            content = self.pages.pop(uri) # each page is only parsed once so free it up
+            if isinstance(content, Exception):
+                raise content
+            return content
+        return self.getPage(uri)
+
+    def pipeline(self, tasks, parse):
+        # Yields (key, parse(key, content)) for every (uri, key) in tasks, in the order they were given
+        # Pages are downloaded into a bounded queue and parsed in a pool of processes as they arrive, so downloading and parsing overlap
+        downloaded = queue.Queue(maxsize=self.workers * 2)
+        stop = threading.Event()
+
+        def fetch(position, uri):
+            try:
+                item = (position, self.takePage(uri))
+            except Exception as error:
+                item = (position, error)
+            while not stop.is_set(): # waits here while the parsers catch up
+                try:
+                    downloaded.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
+
+        pool = None if self.jobs == 1 else ProcessPoolExecutor(max_workers=self.jobs, mp_context=Scheduler.processContext())
+        limit = (self.jobs or os.cpu_count() or 1) * 2 # pages handed to the parsers at once
+        downloads = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            for position, (uri, key) in enumerate(tasks):
+                downloads.submit(fetch, position, uri)
+
+            parsing = {}
+            parsed = {} # results that finished before the ones ahead of them
+            received = 0
+            nextPosition = 0
+            while nextPosition < len(tasks):
+                if received < len(tasks) and len(parsing) < limit:
+                    position, content = downloaded.get()
+                    received += 1
+                    if isinstance(content, Exception):
+                        raise content
+                    key = tasks[position][1]
+                    parsing[pool.submit(parse, key, content) if pool else Scheduler.inline(parse, key, content)] = position
+                    finished = [future for future in parsing if future.done()]
+                else:
+                    finished, pending = wait(parsing, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    parsed[parsing.pop(future)] = future.result()
+                while nextPosition in parsed:
+                    yield tasks[nextPosition][1], parsed.pop(nextPosition)
+                    nextPosition += 1
+        finally:
+            stop.set()
+            downloads.shutdown(cancel_futures=True)
+            if pool:
+                pool.shutdown(cancel_futures=True)
+
+    @Stage.timed
     def getTableSoup(self, uri):
         # Parse the given table into a beautifulsoup object
-        address = self.cycleUrl + uri
+        content = self.takePage(uri)
 
-        http = urllib3.PoolManager()
-        error = http.request("GET", address)
-        if (error.status == 404):
+        if content == 404:
             return 404
+        return BeautifulSoup(content, "lxml")
 
-        page = requests.get(address)
-        return BeautifulSoup(page.content, "lxml")
-
+    @Stage.timed
     def parseAd01Data(self):
         print("Parsing "+ self.country +"-AD-0.1 data to obtain ICAO designators...")
         dfColumns = ['icao_designator','verified','location','elevation','name','magnetic_variation']
-        df = pd.DataFrame(columns=dfColumns)
+        df = Accumulator(dfColumns, {'location': object, 'elevation': object, 'magnetic_variation': object}) # filled in later from the AD-2 pages
         getAerodromeList = self.getTableSoup(self.country + "-AD-0.1-en-GB.html")
         listAerodromeList = getAerodromeList.find_all("h3")
         barLength = len(listAerodromeList)
-        with alive_bar(barLength) as bar: # Define the progress bar
+        with self.progress(barLength) as bar: # Define the progress bar
             for row in listAerodromeList:
                 getAerodrome = re.search(rf"({self.country}[A-Z]{{2}})(\n[\s\S]{{7}}\n[\s\S]{{8}})([A-Z]{{4}}.*)(\n[\s\S]{{6}}<\/a>)", str(row)) # search for aerodrome icao designator and name
                 if getAerodrome:
                     # Place each aerodrome into the DB
                     dfOut = {'icao_designator': str(getAerodrome[1]),'verified': 0,'location': 0,'elevation': 0,'name': str(getAerodrome[3]),'magnetic_variation': 0}
-                    df = df.append(dfOut, ignore_index=True)
+                    df.append(dfOut)
                 bar()
-        return df
+        return df.frame()
 
+    @staticmethod
+    @Stage.timed
+    def parseAd02Page(aeroIcao, content):
+        # Runs in a parser process, returns the aerodrome's details and its runway and service rows or None if it has no page
+        if content == 404:
+            return None
+        getRunways = BeautifulSoup(content, "lxml")
+        aerodromeAd0202 = str(getRunways.find(id=aeroIcao + "-AD-2.2"))
+        aerodromeAd0212 = Webscrape.ad0212Fields.extract(getRunways.find(id=aeroIcao + "-AD-2.12"))
+        aerodromeAd0218 = Webscrape.ad0218Fields.extract(getRunways.find(id=aeroIcao + "-AD-2.18"))
+
+        # Find current magnetic variation for this aerodrome
+        aerodromeMagVar = Webscrape.ad0202Fields.extract(aerodromeAd0202)['magVar']
+        pM = Geo.plusMinus(aerodromeMagVar[0][1])
+        floatMagVar = pM + aerodromeMagVar[0][0]
+
+        # Find lat/lon/elev for aerodrome
+        aerodromeLat = re.search(r'(Lat: )(<span class="SD" id="ID_[\d]{7}">)([\d]{6})([N|S]{1})', aerodromeAd0202)
+        aerodromeLon = re.search(r"(Long: )(<span class=\"SD\" id=\"ID_[\d]{7}\">)([\d]{7})([E|W]{1})", aerodromeAd0202)
+        aerodromeElev = re.search(r"(VAL_ELEV\;)([\d]{1,4})", aerodromeAd0202)
+
+        latPM = Geo.plusMinus(aerodromeLat.group(4))
+        lonPM = Geo.plusMinus(aerodromeLon.group(4))
+        fullLocation = latPM + aerodromeLat.group(3) + ".00" + lonPM + aerodromeLon.group(3) + ".00" # AD-2.2 gives aerodrome location as DDMMSS / DDDMMSS
+
+        aerodrome = {'verified': 1, 'magnetic_variation': str(floatMagVar), 'location': str(fullLocation), 'elevation': str(aerodromeElev[2])}
+
+        # Find runway locations
+        runways = []
+        aerodromeRunways = aerodromeAd0212['runway']
+        aerodromeRunwaysLat = aerodromeAd0212['lat']
+        aerodromeRunwaysLong = aerodromeAd0212['lon']
+        aerodromeRunwaysElev = aerodromeAd0212['elevation']
+        aerodromeRunwaysBearing = aerodromeAd0212['bearing']
+        aerodromeRunwaysLen = aerodromeAd0212['length']
+
+        for rwy, lat, lon, elev, brg, rwyLen in zip(aerodromeRunways, aerodromeRunwaysLat, aerodromeRunwaysLong, aerodromeRunwaysElev, aerodromeRunwaysBearing, aerodromeRunwaysLen):
+            # Add runway to the aerodromeDB
+            loc = Dms.format(Dms.fromCompass([lat[:-1]], [lat[-1]]), Dms.fromCompass([lon[:-1]], [lon[-1]]))[0]
+
+            dfOut = {'icao_designator': str(aeroIcao),'runway': str(rwy),'location': str(loc),'elevation': str(elev),'bearing': str(brg.rstrip('°')),'length': str(rwyLen)}
+            runways.append(dfOut)
+
+        # Find air traffic services
+        services = []
+        aerodromeServices = aerodromeAd0218['service']
+        serviceFrequency = aerodromeAd0218['frequency']
+
+        for srv, frq in zip(aerodromeServices, serviceFrequency):
+            #callSignId = "SELECT id FROM standard_callsigns WHERE description = '"+ str(srv) +"' LIMIT 1"
+            #callSignType = mysqlExec(callSignId, "one")
+            #csModify = re.search(r"([\d]{1,8})", str(callSignType))
+
+            dfOut = {'icao_designator': str(aeroIcao),'callsign_type': str(srv),'frequency': str(frq)}
+            services.append(dfOut)
+
+        return {'aerodrome': aerodrome, 'runways': runways, 'services': services}
+
+    @Stage.timed
     def parseAd02Data(self, dfAd01):
         print("Parsing "+ self.country +"-AD-2.x data to obtain aerodrome data...")
         dfColumns = ['icao_designator','runway','location','elevation','bearing','length']
-        dfRwy = pd.DataFrame(columns=dfColumns)
+        dfRwy = Accumulator(dfColumns)
 
         dfColumns = ['icao_designator','callsign_type','frequency']
-        dfSrv = pd.DataFrame(columns=dfColumns)
-
-        # Select all aerodromes in the database
-        barLength = len(dfAd01.index)
-        with alive_bar(barLength) as bar: # Define the progress bar
-            for index, row in dfAd01.iterrows():
-                aeroIcao = row['icao_designator']
-                # Select all runways in this aerodrome
-                getRunways = self.getTableSoup(self.country + "-AD-2."+ aeroIcao +"-en-GB.html")
-                if getRunways !=404:
-                    print("  Parsing AD-2 data for " + aeroIcao)
-                    aerodromeAd0202 = getRunways.find(id=aeroIcao + "-AD-2.2")
-                    aerodromeAd0212 = getRunways.find(id=aeroIcao + "-AD-2.12")
-                    aerodromeAd0218 = getRunways.find(id=aeroIcao + "-AD-2.18")
-
-                    # Find current magnetic variation for this aerodrome
-                    aerodromeMagVar = self.search("([\d]{1}\.[\d]{2}).([W|E]{1})", "TAD_HP;VAL_MAG_VAR", str(aerodromeAd0202))
-                    pM = Geo.plusMinus(aerodromeMagVar[0][1])
-                    floatMagVar = pM + aerodromeMagVar[0][0]
-
-                    # Find lat/lon/elev for aerodrome
-                    aerodromeLat = re.search(r'(Lat: )(<span class="SD" id="ID_[\d]{7}">)([\d]{6})([N|S]{1})', str(aerodromeAd0202))
-                    aerodromeLon = re.search(r"(Long: )(<span class=\"SD\" id=\"ID_[\d]{7}\">)([\d]{7})([E|W]{1})", str(aerodromeAd0202))
-                    aerodromeElev = re.search(r"(VAL_ELEV\;)([\d]{1,4})", str(aerodromeAd0202))
-
-                    latPM = Geo.plusMinus(aerodromeLat.group(4))
-                    lonPM = Geo.plusMinus(aerodromeLon.group(4))
-                    fullLocation = latPM + aerodromeLat.group(3) + ".00" + lonPM + aerodromeLon.group(3) + ".00" # AD-2.2 gives aerodrome location as DDMMSS / DDDMMSS
-
-                    dfAd01.at[index, 'verified'] = 1
-                    dfAd01.at[index, 'magnetic_variation'] = str(floatMagVar)
-                    dfAd01.at[index, 'location'] = str(fullLocation)
-                    dfAd01.at[index, 'elevation'] = str(aerodromeElev[2])
-
-                    # Find runway locations
-                    aerodromeRunways = self.search("([\d]{2}[L|C|R]?)", "TRWY_DIRECTION;TXT_DESIG", str(aerodromeAd0212))
-                    aerodromeRunwaysLat = self.search("([\d]{6}\.[\d]{2}[N|S]{1})", "TRWY_CLINE_POINT;GEO_LAT", str(aerodromeAd0212))
-                    aerodromeRunwaysLong = self.search("([\d]{7}\.[\d]{2}[E|W]{1})", "TRWY_CLINE_POINT;GEO_LONG", str(aerodromeAd0212))
-                    aerodromeRunwaysElev = self.search("([\d]{3})", "TRWY_CLINE_POINT;VAL_GEOID_UNDULATION", str(aerodromeAd0212))
-                    aerodromeRunwaysBearing = self.search("([\d]{3}\.[\d]{2}.)", "TRWY_DIRECTION;VAL_TRUE_BRG", str(aerodromeAd0212))
-                    aerodromeRunwaysLen = self.search("([\d]{3,4})", "TRWY;VAL_LEN", str(aerodromeAd0212))
-
-                    for rwy, lat, lon, elev, brg, rwyLen in zip(aerodromeRunways, aerodromeRunwaysLat, aerodromeRunwaysLong, aerodromeRunwaysElev, aerodromeRunwaysBearing, aerodromeRunwaysLen):
-                        # Add runway to the aerodromeDB
-                        latSplit = re.search(r"([\d]{6}\.[\d]{2})([N|S]{1})", str(lat))
-                        lonSplit = re.search(r"([\d]{7}\.[\d]{2})([E|W]{1})", str(lon))
-                        latPM = Geo.plusMinus(latSplit.group(2))
-                        lonPM = Geo.plusMinus(lonSplit.group(2))
-                        loc = str(latPM) + str(latSplit.group(1)) + str(lonPM) + str(lonSplit.group(1)) # build lat/lon string as per https://virtualairtrafficsystem.com/docs/dpk/#lat-long-format
-
-                        dfOut = {'icao_designator': str(aeroIcao),'runway': str(rwy),'location': str(loc),'elevation': str(elev),'bearing': str(brg.rstrip('°')),'length': str(rwyLen)}
-                        dfRwy = dfRwy.append(dfOut, ignore_index=True)
-
-                    # Find air traffic services
-                    aerodromeServices = self.search("(APPROACH|GROUND|DELIVERY|TOWER|DIRECTOR|INFORMATION)", "TCALLSIGN_DETAIL", str(aerodromeAd0218))
-                    serviceFrequency = self.search("([\d]{3}\.[\d]{3})", "TFREQUENCY", str(aerodromeAd0218))
-
-                    for srv, frq in zip(aerodromeServices, serviceFrequency):
-                        #callSignId = "SELECT id FROM standard_callsigns WHERE description = '"+ str(srv) +"' LIMIT 1"
-                        #callSignType = mysqlExec(callSignId, "one")
-                        #csModify = re.search(r"([\d]{1,8})", str(callSignType))
-
-                        dfOut = {'icao_designator': str(aeroIcao),'callsign_type': str(srv),'frequency': str(frq)}
-                        dfSrv = dfSrv.append(dfOut, ignore_index=True)
+        dfSrv = Accumulator(dfColumns)
+
+        # Filled in on a copy as ENR-1.6 may be reading the AD-0.1 list at the same time
+        dfAd01 = dfAd01.astype({'location': object, 'elevation': object, 'magnetic_variation': object})
+
+        # Each aerodrome's page is parsed as soon as it has downloaded, the rows still go in in AD-0.1 order
+        tasks = [(self.country + "-AD-2."+ icao +"-en-GB.html", icao) for icao in dfAd01['icao_designator']]
+        barLength = len(tasks)
+        with self.progress(barLength) as bar: # Define the progress bar
+            for index, (aeroIcao, page) in zip(dfAd01.index, self.pipeline(tasks, Webscrape.parseAd02Page)):
+                if page is not None:
+                    print("  Parsed AD-2 data for " + aeroIcao)
+                    for column, value in page['aerodrome'].items():
+                        dfAd01.at[index, column] = value
+                    for dfOut in page['runways']:
+                        dfRwy.append(dfOut)
+                    for dfOut in page['services']:
+                        dfSrv.append(dfOut)
                 else:
                     print(Fore.RED + "Aerodrome " + aeroIcao + " does not exist" + Style.RESET_ALL)
                 bar()
-        return [dfAd01, dfRwy, dfSrv]
+        return [dfAd01, dfRwy.frame(), dfSrv.frame()]
 
+    @Stage.timed
     def parseEnr016Data(self, dfAd01):
         print("Parsing "+ self.country + "-AD-1.6 data to obtan SSR code allocation plan")
         dfColumns = ['start','end','depart','arrive', 'string']
-        df = pd.DataFrame(columns=dfColumns)
+        df = Accumulator(dfColumns)
 
         webpage = self.getTableSoup(self.country + "-ENR-1.6-en-GB.html")
         getDiv = webpage.find("div", id = "ENR-1.6.2.6")
         getTr = getDiv.find_all('tr')
         barLength = len(getTr)
-        with alive_bar(barLength) as bar: # Define the progress bar
+        with self.progress(barLength) as bar: # Define the progress bar
             for row in getTr:
                 getP = row.find_all('p')
                 if len(getP) > 1:
@@ -217,39 +757,43 @@ class Webscrape:
                                 name = dfAd01[dfAd01['name'].str.contains(strip.group(1), case=False, na=False)]
                                 if len(name.index) == 1:
                                     dfOut = {'start': start,'end': end,'depart': dep,'arrive': name.iloc[0]['icao_designator'],'string': strip.group(1)}
-                                    df = df.append(dfOut, ignore_index=True)
+                                    df.append(dfOut)
                                 elif strip.group(1) == "RAF" or strip.group(1) == "Military" or strip.group(1) == "RNAS" or strip.group(1) == "NATO":
                                     dfOut = {'start': start,'end': end,'depart': dep,'arrive': 'Military','string': strip.group(1)}
-                                    df = df.append(dfOut, ignore_index=True)
+                                    df.append(dfOut)
                                 elif strip.group(1) == "Transit":
                                     dfOut = {'start': start,'end': end,'depart': dep,'arrive': locArray[2],'string': strip.group(1)}
-                                    df = df.append(dfOut, ignore_index=True)
+                                    df.append(dfOut)
                 bar()
-        return(df)
+        return df.frame()
 
+    @Stage.timed
     def parseEnr02Data(self):
         dfColumns = ['name', 'callsign', 'frequency', 'boundary', 'upper_fl', 'lower_fl']
-        dfFir = pd.DataFrame(columns=dfColumns)
-        dfUir = pd.DataFrame(columns=dfColumns)
+        dfFir = Accumulator(dfColumns)
+        dfUir = Accumulator(dfColumns)
 
         dfColumns = ['fir_id', 'name', 'boundary']
-        dfCta = pd.DataFrame(columns=dfColumns)
-        dfTma = pd.DataFrame(columns=dfColumns)
+        dfCta = Accumulator(dfColumns)
+        dfTma = Accumulator(dfColumns)
 
         print("Parsing "+ self.country +"-ENR-2.1 Data (FIR, UIR, TMA AND CTA)...")
         getData = self.getTableSoup(self.country + "-ENR-2.1-en-GB.html")
         searchData = getData.find_all("td")
         barLength = len(searchData)
-        with alive_bar(barLength) as bar: # Define the progress bar
+        with self.progress(barLength) as bar: # Define the progress bar
             for row in searchData:
+                rowText = str(row)
+                fields = self.enr021Fields.extract(rowText)
+
                 # find all FIR/UIR spaces
-                firTitle = self.search("([A-Z]*\sFIR)", "TAIRSPACE;TXT_NAME", str(row))
-                firSpace = self.search("([\d]{6,7})([N|E|S|W]{1})", "TAIRSPACE_VERTEX;GEO_L", str(row))
-                firUpper = self.search("(?<=\>)([\d]{2,3})", "TAIRSPACE_LAYER;VAL_DIST_VER_UPPER", str(row))
-                firLower = self.search("(?<=\>)([\d]{2,3})", "TAIRSPACE_LAYER;VAL_DIST_VER_LOWER", str(row))
+                firTitle = fields['firTitle']
+                firSpace = fields['space']
+                firUpper = fields['layerUpper']
+                firLower = fields['layerLower']
                 if not firUpper:
-                    firUpper = self.search("(?<=\>)([\d]{2,3})", "TAIRSPACE_VOLUME;VAL_DIST_VER_UPPER", str(row))
-                    firLower = self.search("(?<=\>)([\d]{2,3})", "TAIRSPACE_VOLUME;VAL_DIST_VER_LOWER", str(row))
+                    firUpper = fields['volumeUpper']
+                    firLower = fields['volumeLower']
                     if not firLower:
                         firLower = "0"
 
@@ -257,16 +801,16 @@ class Webscrape:
                     if firSpace:
                         boundary = self.getBoundary(firSpace)
                         dfOut = {'name': str(firTitle[0]),'callsign': 'NONE','frequency': '000.000', 'boundary': str(boundary), 'upper_fl': str(firUpper[0]), 'lower_fl': str(firLower[0])}
-                        dfFir = dfFir.append(dfOut, ignore_index=True)
+                        dfFir.append(dfOut)
 
                         # lazy bit of coding for EG airspace UIR (which has the same extent as FIR)
                         dfOut = {'name': str(firTitle[0]).split()[0] + ' UIR','callsign': 'NONE','frequency': '000.000', 'boundary': str(boundary), 'upper_fl': '660', 'lower_fl': '245'}
-                        dfUir = dfUir.append(dfOut, ignore_index=True)
+                        dfUir.append(dfOut)
 
                 # find all CTA spaces
-                ctaTitle = self.search("([A-Z\s]*)(\sCTA\s)([\d]?)", "TAIRSPACE;TXT_NAME", str(row))
-                ctaSpace = self.search("([\d]{6,7})([N|E|S|W]{1})", "TAIRSPACE_VERTEX;GEO_L", str(row))
-                ctaCircle = re.search("circle", str(row))
+                ctaTitle = fields['ctaTitle']
+                ctaSpace = fields['space']
+                ctaCircle = "circle" in rowText
                 if ctaTitle:
                     if not ctaCircle:
                         fF = re.search(r"(\')([A-Z\s]*)(\')(.*)(\sCTA\s)(.*)([\d]{1,2}?)", str(ctaTitle))
@@ -279,14 +823,14 @@ class Webscrape:
                             boundary = self.getBoundary(ctaSpace)
 
                             dfOut = {'fir_id': '0', 'name': str(title), 'boundary': str(boundary)}
-                            dfCta = dfCta.append(dfOut, ignore_index=True)
+                            dfCta.append(dfOut)
                     else:
                         print(str(ctaTitle) + " complex CTA")
 
                 # find all TMA spaces
-                tmaTitle = self.search("([A-Z\s]*)(\sTMA\s)([\d]?)", "TAIRSPACE;TXT_NAME", str(row))
-                tmaSpace = self.search("([\d]{6,7})([N|E|S|W]{1})", "TAIRSPACE_VERTEX;GEO_L", str(row))
-                tmaCircle = re.search("circle", str(row))
+                tmaTitle = fields['tmaTitle']
+                tmaSpace = fields['space']
+                tmaCircle = "circle" in rowText
                 if tmaTitle:
                     if not tmaCircle:
                         fF = re.search(r"(\')([A-Z\s]*)(\')(.*)(\sTMA\s)(.*)([\d]{1,2}?)", str(tmaTitle))
@@ -299,51 +843,53 @@ class Webscrape:
                             boundary = self.getBoundary(tmaSpace)
 
                             dfOut = {'fir_id': '0', 'name': str(title), 'boundary': str(boundary)}
-                            dfTma = dfTma.append(dfOut, ignore_index=True)
+                            dfTma.append(dfOut)
                     else:
                         print(str(tmaTitle) + " complex TMA")
                 bar()
-        return [dfFir, dfUir, dfCta, dfTma]
+        return [dfFir.frame(), dfUir.frame(), dfCta.frame(), dfTma.frame()]
 
+    @Stage.timed
     def parseEnr03Data(self, section):
         dfColumns = ['name', 'route']
-        dfEnr03 = pd.DataFrame(columns=dfColumns)
+        dfEnr03 = Accumulator(dfColumns)
         print("Parsing "+ self.country +"-ENR-3."+ section +" data to obtain ATS routes...")
         getENR3 = self.getTableSoup(self.country + "-ENR-3."+ section +"-en-GB.html")
         listTables = getENR3.find_all("tbody")
         barLength = len(listTables)
-        with alive_bar(barLength) as bar: # Define the progress bar
+        with self.progress(barLength) as bar: # Define the progress bar
             for row in listTables:
-                getAirwayName = self.search("([A-Z]{1,2}[\d]{1,4})", "TEN_ROUTE_RTE;TXT_DESIG", str(row))
-                getAirwayRoute = self.search("([A-Z]{3,5})", "T(DESIGNATED_POINT|DME|VOR|NDB);CODE_ID", str(row))
+                fields = self.enr03Fields.extract(row)
+                getAirwayName = fields['name']
+                getAirwayRoute = fields['route']
                 printRoute = ''
                 if getAirwayName:
                     for point in getAirwayRoute:
                         printRoute += str(point[0]) + "/"
                     dfOut = {'name': str(getAirwayName[0]), 'route': str(printRoute).rstrip('/')}
-                    dfEnr03 = dfEnr03.append(dfOut, ignore_index=True)
+                    dfEnr03.append(dfOut)
                 bar()
-        return dfEnr03
+        return dfEnr03.frame()
 
+    @Stage.timed
     def parseEnr04Data(self, sub):
         dfColumns = ['name', 'type', 'coords']
-        df = pd.DataFrame(columns=dfColumns)
+        df = Accumulator(dfColumns)
         print("Parsing "+ self.country +"-ENR-4."+ sub +" Data (RADIO NAVIGATION AIDS - EN-ROUTE)...")
         getData = self.getTableSoup(self.country + "-ENR-4."+ sub +"-en-GB.html")
         listData = getData.find_all("tr", class_ = "Table-row-type-3")
         barLength = len(listData)
-        with alive_bar(barLength) as bar: # Define the progress bar
+        with self.progress(barLength) as bar: # Define the progress bar
             for row in listData:
                 # Split out the point name
                 id = row['id']
                 name = id.split('-')
 
                 # Find the point location
-                pointLat = self.search(r"([\d]{6})([N|S]{1})", "T", str(row))
-                pointLon = self.search(r"([\d]{7})([E|W]{1})", "T", str(row))
-                latPM = Geo.plusMinus(pointLat[0][1])
-                lonPM = Geo.plusMinus(pointLon[0][1])
-                fullLocation = latPM + pointLat[0][0] + ".00" + lonPM + pointLon[0][0] + ".00" # ENR-4 gives aerodrome location as DDMMSS / DDDMMSS
+                fields = self.enr04Fields.extract(row)
+                pointLat = fields['lat']
+                pointLon = fields['lon']
+                fullLocation = Dms.format(Dms.fromCompass([pointLat[0][0]], [pointLat[0][1]]), Dms.fromCompass([pointLon[0][0]], [pointLon[0][1]]))[0] # ENR-4 gives aerodrome location as DDMMSS / DDDMMSS
 
                 if sub == "1":
                     # Do this for ENR-4.1
@@ -359,126 +905,228 @@ class Webscrape:
                     # Add fix to the aerodromeDB
                     dfOut = {'name': str(name[1]), 'type': 'FIX', 'coords': str(fullLocation)}
 
-                df = df.append(dfOut, ignore_index=True)
+                df.append(dfOut)
                 bar()
-        return df
+        return df.frame()
 
+    @Stage.timed
     def parseEnr051Data(self):
         dfColumns = ['name', 'boundary', 'floor', 'ceiling']
-        dfEnr05 = pd.DataFrame(columns=dfColumns)
+        dfEnr05 = Accumulator(dfColumns)
         print("Parsing "+ self.country +"-ENR-5.1 data for PROHIBITED, RESTRICTED AND DANGER AREAS...")
         getENR5 = self.getTableSoup(self.country + "-ENR-5.1-en-GB.html")
         listTables = getENR5.find_all("tr")
         barLength = len(listTables)
-        with alive_bar(barLength) as bar: # Define the progress bar
+        with self.progress(barLength) as bar: # Define the progress bar
             for row in listTables:
-                getId = self.search("((EG)\s(D|P|R)[\d]{3}[A-Z]*)", "TAIRSPACE;CODE_ID", str(row))
-                getName = self.search("([A-Z\s]*)", "TAIRSPACE;TXT_NAME", str(row))
-                getLoc = self.search("([\d]{6,7})([N|E|S|W]{1})", "TAIRSPACE_VERTEX;GEO_L", str(row))
-                getUpper = self.search("([\d]{3,5})", "TAIRSPACE_VOLUME;VAL_DIST_VER_UPPER", str(row))
-                #getLower = self.search("([\d]{3,5})|(SFC)", "TAIRSPACE_VOLUME;VAL_DIST_VER_LOWER", str(row))
+                fields = self.enr051Fields.extract(row)
+                getId = fields['id']
+                getName = fields['name']
+                getLoc = fields['space']
+                getUpper = fields['upper']
 
                 if getId:
                     for upper in getUpper:
                         up = upper
                     dfOut = {'name': str(getId[0][0]) + ' ' + str(getName[2]), 'boundary': self.getBoundary(getLoc), 'floor': 0, 'ceiling': str(up)}
-                    dfEnr05 = dfEnr05.append(dfOut, ignore_index=True)
+                    dfEnr05.append(dfOut)
 
                 bar()
-        return dfEnr05
+        return dfEnr05.frame()
 
     def test(self): # testing code - remove for live
         test = self.parseEnr051Data()
-        test.to_csv('Dataframes/Enr051.csv')
-
+        Store().write('Enr051', test)
+
+    def stages(self):
+        # name: (stages it needs, pages it needs, function given the output of those stages, tables it returns)
+        enr = lambda page: self.country + "-ENR-" + page + "-en-GB.html"
+        return {
+            'AD-0.1': ([], [self.country + "-AD-0.1-en-GB.html"], lambda: [self.parseAd01Data()], ['Ad01']),
+            'AD-2': (['AD-0.1'], [], lambda ad01: self.parseAd02Data(ad01[0]), ['Ad01', 'Ad02-Runways', 'Ad02-Services']), # pages come from the AD-0.1 list
+            'ENR-1.6': (['AD-0.1'], [enr("1.6")], lambda ad01: [self.parseEnr016Data(ad01[0])], ['Enr016']),
+            'ENR-2.1': ([], [enr("2.1")], self.parseEnr02Data, ['Enr02-FIR', 'Enr02-UIR', 'Enr02-CTA', 'Enr02-TMA']),
+            'ENR-3.1': ([], [enr("3.1")], lambda: [self.parseEnr03Data('1')], ['Enr031']),
+            'ENR-3.3': ([], [enr("3.3")], lambda: [self.parseEnr03Data('3')], ['Enr033']),
+            'ENR-3.5': ([], [enr("3.5")], lambda: [self.parseEnr03Data('5')], ['Enr035']),
+            'ENR-4.1': ([], [enr("4.1")], lambda: [self.parseEnr04Data('1')], ['Enr041']),
+            'ENR-4.4': ([], [enr("4.4")], lambda: [self.parseEnr04Data('4')], ['Enr044']),
+            'ENR-5.1': ([], [enr("5.1")], lambda: [self.parseEnr051Data()], ['Enr051']),
+        }
+
+    def withPages(self, pages, run):
+        # Each stage downloads its own pages first, so one that can't be fetched only fails the stage that needs it
+        def stage(*inputs):
+            if pages:
+                self.fetchPages(pages)
+            return run(*inputs)
+        return stage
+
+    def checkpointDir(self, name):
+        return os.path.join(self.cache.indexDir, "Stages", name)
+
+    def loadCheckpoint(self, name):
+        # The tables a stage returned earlier this cycle, or None if it has to be run again
+        markerFile = os.path.join(self.checkpointDir(name), "done.json")
+        if not os.path.exists(markerFile):
+            return None
+        with open(markerFile, "r") as f:
+            tables = json.load(f)['tables']
+        if tables != self.stages()[name][3]:
+            return None
+        store = Store(self.checkpointDir(name))
+        return [store.read(table) for table in tables]
+
+    def saveCheckpoint(self, name, frames):
+        # The marker is written last so a stage that stops half way through saving is run again
+        store = Store(self.checkpointDir(name))
+        tables = self.stages()[name][3]
+        for table, df in zip(tables, frames):
+            store.write(table, df, csv=False)
+        markerFile = os.path.join(self.checkpointDir(name), "done.json")
+        with open(markerFile + ".tmp", "w") as f:
+            json.dump({'tables': tables, 'finished': ctime(time())}, f)
+        os.replace(markerFile + ".tmp", markerFile)
+
+    @Stage.timed
     def run(self):
-        Ad01 = self.parseAd01Data() # returns single dataframe
-        Ad02 = self.parseAd02Data(Ad01) # returns dfAd01, dfRwy, dfSrv
-        Enr016 = self.parseEnr016Data(Ad01) # returns single dataframe
-        Enr02 = self.parseEnr02Data() # returns dfFir, dfUir, dfCta, dfTma
-        Enr031 = self.parseEnr03Data('1') # returns single dataframe
-        Enr033 = self.parseEnr03Data('3') # returns single dataframe
-        Enr035 = self.parseEnr03Data('5') # returns single dataframe
-        Enr041 = self.parseEnr04Data('1') # returns single dataframe
-        Enr044 = self.parseEnr04Data('4') # returns single dataframe
-        Enr051 = self.parseEnr051Data() # returns single dataframe
-
-        Ad01.to_csv('Dataframes/Ad01.csv')
-        Ad02[1].to_csv('Dataframes/Ad02-Runways.csv')
-        Ad02[2].to_csv('Dataframes/Ad02-Services.csv')
-        Enr016.to_csv('Dataframes/Enr016.csv')
-        Enr02[0].to_csv('DataFrames/Enr02-FIR.csv')
-        Enr02[1].to_csv('DataFrames/Enr02-UIR.csv')
-        Enr02[2].to_csv('DataFrames/Enr02-CTA.csv')
-        Enr02[3].to_csv('DataFrames/Enr02-TMA.csv')
-        Enr031.to_csv('DataFrames/Enr031.csv')
-        Enr033.to_csv('DataFrames/Enr033.csv')
-        Enr035.to_csv('DataFrames/Enr035.csv')
-        Enr041.to_csv('DataFrames/Enr041.csv')
-        Enr044.to_csv('DataFrames/Enr044.csv')
-        Enr051.to_csv('Dataframes/Enr051.csv')
-
-        return [Ad01, Ad02, Enr016, Enr02, Enr031, Enr033, Enr035, Enr041, Enr044, Enr051]
+        stages = self.stages()
+        scheduler = Scheduler({name: (needs, self.withPages(pages, run)) for name, (needs, pages, run, tables) in stages.items()}, self.stageWorkers)
+        saved = {}
+        if self.resume:
+            saved = {name: self.loadCheckpoint(name) for name in stages}
 
-    @staticmethod
-    def search(find, name, string):
-        searchString = find + "(?=<\/span>.*>" + name + ")"
-        result = re.findall(rf"{str(searchString)}", str(string))
-        return result
+        self.quiet = self.stageWorkers > 1
+        try:
+            results, failed = scheduler.run(saved.get, self.saveCheckpoint)
+        finally:
+            self.quiet = False
+        if failed:
+            raise RuntimeError("Stage(s) " + ", ".join(failed) + " failed, run again with --resume to only rerun these")
+
+        # Write every table to the store in the order the Builder expects them, AD-2 returns the completed AD-0.1 list
+        tables = {}
+        for name in ['AD-0.1'] + [name for name in stages if name != 'AD-0.1']:
+            tables.update(zip(stages[name][3], results[name]))
+        store = Store()
+        for name in Store.tables:
+            store.write(name, tables[name])
+
+        return store
 
     @staticmethod
     def getBoundary(space): # creates a boundary useable in vatSys from AIRAC data
-        lat = 1
-        fullBoundary = ''
-        for s in space:
-            if s[1] == "W" or s[1] == "S":
-                symbol = "-"
-            else:
-                symbol = "+"
+        # vertices alternate lat, lon so an unpaired trailing latitude is dropped
+        pairs = len(space) // 2
+        if pairs == 0:
+            return ''
+        vertices = np.array(space[:pairs * 2], dtype=str).reshape(pairs, 2, 2)
+        lat = Dms.fromCompass(vertices[:, 0, 0], vertices[:, 0, 1])
+        lon = Dms.fromCompass(vertices[:, 1, 0], vertices[:, 1, 1])
+        return '/'.join(Dms.format(lat, lon))
+
+class Manifest:
+    '''Class to record which inputs every built file came from so unchanged files can be left alone'''
+
+    schemaVersion = 1 # bump this when the layout of the built files changes
+    sources = ["generate.py", "coordinates.py", "simplify.py"] # a change to the code that writes the files rebuilds everything
+
+    def __init__(self, manifestFile="Build/manifest.json"):
+        self.manifestFile = manifestFile
+        self.fingerprint = self.digest([self.schemaVersion] + [self.fileDigest(source) for source in self.sources])
+        self.previous = {}
+        self.orphans = set()
+        if os.path.exists(manifestFile):
+            with open(manifestFile, "r") as f:
+                saved = json.load(f)
+            self.orphans = set(saved['outputs'])
+            if saved['fingerprint'] == self.fingerprint:
+                self.previous = saved['outputs']
+        self.outputs = {} # output file -> digest of its inputs for this run
+        self.written = [] # files that were (re)written this run
+        self.kept = [] # files left untouched because their inputs have not changed
 
-            if lat == 1:
-                coordString = symbol + s[0] + ".00"
-                lat = 0
-            else:
-                coordString += symbol + s[0]
-                fullBoundary += coordString + ".00/"
-                lat = 1
+    @staticmethod
+    def digest(inputs):
+        # Anything json can represent, pandas and numpy values are turned into strings
+        text = json.dumps(inputs, sort_keys=True, default=str)
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
-        return fullBoundary.rstrip('/')
+    @staticmethod
+    def fileDigest(filename):
+        if not os.path.exists(filename):
+            return None
+        with open(filename, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+    @staticmethod
+    def frameDigest(df):
+        rows = pd.util.hash_pandas_object(df, index=True).values
+        return hashlib.sha256(rows.tobytes() + str(list(df.columns)).encode("utf-8")).hexdigest()
+
+    def unchanged(self, fileOut, digest):
+        return self.previous.get(fileOut) == digest and os.path.exists(fileOut)
+
+    def record(self, fileOut, digest, written):
+        self.outputs[fileOut] = digest
+        self.orphans.discard(fileOut)
+        Metrics.count('files_written' if written else 'files_unchanged')
+        if written:
+            self.written.append(fileOut)
+        else:
+            self.kept.append(fileOut)
+
+    def forget(self, files):
+        # files that failed validation are rebuilt (and so validated again) next time
+        for fileOut in files:
+            self.outputs.pop(fileOut, None)
+
+    @Stage.timed
+    def finish(self):
+        # delete anything the last build wrote that this build did not
+        for fileOut in sorted(self.orphans):
+            if os.path.exists(fileOut):
+                os.remove(fileOut)
+                print(Fore.YELLOW + "Removed " + fileOut + Style.RESET_ALL)
+                if not os.listdir(os.path.dirname(fileOut)):
+                    os.rmdir(os.path.dirname(fileOut)) # e.g. an aerodrome that has been dropped
+        self.orphans = set()
+        self.save()
+        print(str(len(self.written)) + " file(s) written, " + str(len(self.kept)) + " unchanged")
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.manifestFile), exist_ok=True)
+        with open(self.manifestFile + ".tmp", "w") as f:
+            json.dump({'fingerprint': self.fingerprint, 'outputs': self.outputs}, f, indent=1, sort_keys=True)
+        os.replace(self.manifestFile + ".tmp", self.manifestFile)
 
 class Builder:
     '''Class to build xml files from the dataframes for vatSys'''
 
-    def __init__(self, fileImport=0):
+    def __init__(self, fileImport=0, webscrape=None, jobs=1):
         self.mapCentre = "+53.7-1.5"
+        self.jobs = jobs # number of processes used to build the aerodrome maps, None for one per CPU
+        self.manifest = Manifest()
         # if there are dataframe files present then use those, else run the webscraper
         if fileImport == 1:
-            scrape = []
-            scrape.append(pd.read_csv('Dataframes/Ad01.csv', index_col=0))          #0
-            scrape.append(pd.read_csv('Dataframes/Ad02-Runways.csv', index_col=0))  #1
-            scrape.append(pd.read_csv('Dataframes/Ad02-Services.csv', index_col=0)) #2
-            scrape.append(pd.read_csv('Dataframes/Enr016.csv', index_col=0))        #3
-            scrape.append(pd.read_csv('DataFrames/Enr02-FIR.csv', index_col=0))     #4
-            scrape.append(pd.read_csv('DataFrames/Enr02-UIR.csv', index_col=0))     #5
-            scrape.append(pd.read_csv('DataFrames/Enr02-CTA.csv', index_col=0))     #6
-            scrape.append(pd.read_csv('DataFrames/Enr02-TMA.csv', index_col=0))     #7
-            scrape.append(pd.read_csv('DataFrames/Enr031.csv', index_col=0))        #8
-            scrape.append(pd.read_csv('DataFrames/Enr033.csv', index_col=0))        #9
-            scrape.append(pd.read_csv('DataFrames/Enr035.csv', index_col=0))        #10
-            scrape.append(pd.read_csv('DataFrames/Enr041.csv', index_col=0))        #11
-            scrape.append(pd.read_csv('DataFrames/Enr044.csv', index_col=0))        #12
-            scrape.append(pd.read_csv('DataFrames/Enr051.csv', index_col=0))        #13
-            self.scrape = scrape
+            # Tables are loaded from the store the first time they are used, by position:
+            # 0 Ad01, 1 Ad02-Runways, 2 Ad02-Services, 3 Enr016, 4 Enr02-FIR, 5 Enr02-UIR, 6 Enr02-CTA,
+            # 7 Enr02-TMA, 8 Enr031, 9 Enr033, 10 Enr035, 11 Enr041, 12 Enr044, 13 Enr051
+            self.scrape = Store()
         else:
-            initWebscrape = Webscrape()
+            initWebscrape = webscrape or Webscrape()
             self.scrape = initWebscrape.run()
 
+    @Stage.timed
     def run(self):
+        # Hash every dataframe once, each file then records the ones it is built from
+        self.frameDigests = [Manifest.frameDigest(df) for df in self.scrape]
+
         airspace = self.buildAirspaceXml()
         allAirports = self.buildMapsAllAirportsXml()
         allNavaids = self.buildMapsAllNavaidsXml()
-        allCta = self.buildOtherTopLevelMaps('ALL_CTA', '2')
-        allTma = self.buildOtherTopLevelMaps('ALL_TMA', '2')
+        allCta = {suffix: self.buildOtherTopLevelMaps('ALL_CTA' + suffix, '2') for suffix, tolerance in Simplify.levels}
+        allTma = {suffix: self.buildOtherTopLevelMaps('ALL_TMA' + suffix, '2') for suffix, tolerance in Simplify.levels}
         self.buildSectors()
         self.buildRestrictedAreas()
         self.buildPositions()
@@ -487,167 +1135,38 @@ class Builder:
         dfVerified = dfAd01.loc[dfAd01['verified'] == 1] # select all verified aerodromes (verified as in a page was found in the eAIP corresponding to the icao_designator)
         barLength = len(dfVerified.index)
 
-        with alive_bar(barLength) as bar: # Define the progress bar
-            for index, row in dfVerified.iterrows():
-                print(Fore.BLUE + "Constructing XML for " + row['icao_designator'] + " ("+ row['name'] +")" + Style.RESET_ALL)
-                # set airport name (icao) under Airspace/SystemRunways
-                xmlAerodrome = xtree.SubElement(airspace[0], 'Airport')
-                xmlAerodrome.set('Name',row['icao_designator'])
-                # set airport name (icao) under Airspace/Airports
-                xmlAirport = xtree.SubElement(airspace[3], 'Airport')
-                xmlAirport.set('ICAO', row['icao_designator'])
-                xmlAirport.set('Position', row['location'])
-                xmlAirport.set('Elevation', str(row['elevation']))
+        # Group the runways once by aerodrome
+        runwaysByIcao = {}
+        for rwy in self.scrape[1].to_dict('records'):
+            runwaysByIcao.setdefault(rwy['icao_designator'], []).append(rwy)
+
+        # Work out every threshold the eAIP doesn't give us before the aerodromes are built
+        self.syntheticThresholds = self.buildSyntheticThresholds(runwaysByIcao)
+
+        # Prime the procedure indexes so worker processes start with them
+        Navigraph.index("Navigraph/sids.txt")
+        Navigraph.index("Navigraph/stars.txt")
+
+        tasks = []
+        for row in dfVerified.to_dict('records'):
+            icao = row['icao_designator']
+            synthetic = {t['runway']: t['position'] for t in self.syntheticThresholds if t['icao_designator'] == icao}
+            previous = {f: d for f, d in self.manifest.previous.items() if f.startswith('Build/Maps/' + icao + '/')}
+            tasks.append((row, runwaysByIcao.get(icao, []), synthetic, previous))
+
+        with Stage("Builder.mapAerodromes"), alive_bar(barLength) as bar: # Define the progress bar
+            # Aerodromes are built independently and merged back in their original order
+            for (row, runways, synthetic, previous), fragments in zip(tasks, self.mapAerodromes(tasks)):
+                xmlAerodrome, xmlSidStars, xmlAirport, outputs = fragments
+                for fileOut, digest, written in outputs:
+                    self.manifest.record(fileOut, digest, written)
+                airspace[0].append(xmlAerodrome) # Airspace/SystemRunways
+                airspace[1].extend(xmlSidStars) # Airspace/SIDSTARs
+                airspace[3].append(xmlAirport) # Airspace/Airports
+
                 # Set points in Maps\ALL_AIRPORTS.xml
                 self.elementPoint(allAirports[0], row['icao_designator']) # set label
                 self.elementPoint(allAirports[1], row['icao_designator']) # set symbol
-
-                dfAd02Runways = self.scrape[1]
-                dfAd02RunwaysFilter = dfAd02Runways.loc[dfAd02Runways['icao_designator'] == row['icao_designator']] # select all runways that belong to this aerodrome
-
-                for indexRwy, rwy in dfAd02RunwaysFilter.iterrows():
-                    xmlRunway = xtree.SubElement(xmlAerodrome, 'Runway')
-                    xmlRunway.set('Name', rwy['runway'])
-                    xmlRunway.set('DataRunway', rwy['runway'])
-
-                    # create XML maps for each runway
-                    #figure out the other end of the runway first
-                    oppEndSplit = re.match(r'([\d]{2})([L|R|C])?', rwy['runway'])
-                    if int(oppEndSplit.group(1)) < 18:
-                        oppEnd = int(oppEndSplit.group(1)) + 18
-                    else:
-                        oppEnd = int(oppEndSplit.group(1)) - 18
-
-                    if oppEndSplit.group(2):
-                        if oppEndSplit.group(2) == "L":
-                            oppEnd = str(oppEnd).zfill(2) + "R"
-                        elif oppEndSplit.group(2) == "R":
-                            oppEnd = str(oppEnd).zfill(2) + "L"
-                        elif oppEndSplit.group(2) == "C":
-                            oppEnd = str(oppEnd).zfill(2) + "C"
-                    else:
-                        oppEnd = str(oppEnd).zfill(2)
-
-                    xmlMapsRunway = self.root('Maps')
-                    xmlMapsRunwayMap = self.constructMapHeader(xmlMapsRunway, 'System', row['icao_designator'] + '_TWR_RWY_' + rwy['runway'], '1', rwy['location'])
-                    xmlMapsRunwayMapRwy = xtree.SubElement(xmlMapsRunwayMap, 'Runway')
-                    xmlMapsRunwayMapRwy.set('Name', rwy['runway'])
-                    xmlMapsRunwayThresh = xtree.SubElement(xmlMapsRunwayMapRwy, 'Threshold')
-                    xmlMapsRunwayThresh.set('Name', rwy['runway'])
-                    xmlMapsRunwayThresh.set('Position', rwy['location'])
-                    centreLineTrack = Geo.backBearing(rwy['bearing'])
-                    xmlMapsRunwayThresh.set('ExtendedCentrelineTrack', str(centreLineTrack))
-                    xmlMapsRunwayThresh.set('ExtendedCentrelineLength', "10")
-                    xmlMapsRunwayThresh.set('ExtendedCentrelineTickInterval', "1")
-                    xmlMapsRunwayThreshOpp = xtree.SubElement(xmlMapsRunwayMapRwy, 'Threshold')
-
-                    # add SIDs into the runway map
-                    mapPoint = set() # create a set to store all SID/STAR waypoints for this aerodrome
-                    sids = Navigraph.sidStar("Navigraph/sids.txt", row['icao_designator'], rwy['runway'])
-
-                    xmlMapsRunwaySid = self.constructMapHeader(xmlMapsRunway, 'System', row['icao_designator'] + '_TWR_RWY_' + rwy['runway'] + "_SID", '1', rwy['location'])
-                    for sid in sids['Route']:
-                        xmlMapsRunwayLine = xtree.SubElement(xmlMapsRunwaySid, 'Line')
-                        xmlMapsRunwayLine.text = sid
-
-                        sidSplit = sid.split('/')
-                        for point in sidSplit:
-                            mapPoint.add(point)
-
-                    for i in sids.index:
-                        xmlSid = xtree.SubElement(xmlRunway, 'SID')
-                        xmlSid.set('Name', sids['Name'][i])
-
-                        xmlSidStarSid = xtree.SubElement(airspace[1], 'SID')
-                        xmlSidStarSid.set('Name', sids['Name'][i])
-                        xmlSidStarSid.set('Airport', sids['ICAO'][i])
-                        xmlSidStarSid.set('Runways', sids['Runway'][i])
-
-                        xmlRoute = xtree.SubElement(xmlSidStarSid, 'Route')
-                        xmlRoute.set('Runway', sids['Runway'][i])
-                        slashToSpace = sids['Route'][i].replace('/', ' ')
-                        xmlRoute.text = slashToSpace
-
-                    # add STARs into the runway map
-                    stars = Navigraph.sidStar("Navigraph/stars.txt", row['icao_designator'], rwy['runway'])
-
-                    xmlMapsRunwayStar = self.constructMapHeader(xmlMapsRunway, 'System', row['icao_designator'] + '_TWR_RWY_' + rwy['runway'] + "_STAR", '1', rwy['location'])
-                    for star in stars['Route']:
-                        xmlMapsRunwayLine = xtree.SubElement(xmlMapsRunwayStar, 'Line')
-                        xmlMapsRunwayLine.set('Pattern', 'Dotted')
-                        xmlMapsRunwayLine.text = star
-
-                        starSplit = star.split('/')
-                        for point in starSplit:
-                            mapPoint.add(point)
-
-                    for i in stars.index:
-                        xmlSid = xtree.SubElement(xmlRunway, 'STAR')
-                        xmlSid.set('Name', stars['Name'][i])
-
-                        xmlSidStarStar = xtree.SubElement(airspace[1], 'STAR')
-                        xmlSidStarStar.set('Name', stars['Name'][i])
-                        xmlSidStarStar.set('Airport', stars['ICAO'][i])
-                        xmlSidStarStar.set('Runways', stars['Runway'][i])
-
-                        xmlRoute = xtree.SubElement(xmlSidStarStar, 'Route')
-                        xmlRoute.set('Runway', stars['Runway'][i])
-                        slashToSpace = stars['Route'][i].replace('/', ' ')
-                        xmlRoute.text = slashToSpace
-
-                    dfAd02RunwaysOpp = self.scrape[1]
-                    dfAd02RunwaysOppFilter = dfAd02RunwaysOpp.loc[(dfAd02RunwaysOpp['icao_designator'] == row['icao_designator']) & (dfAd02RunwaysOpp['runway'] == str(oppEnd))] # select all runways that belong to this aerodrome
-
-                    if(len(dfAd02RunwaysOppFilter) > 0):
-                        for indexOppRwy, oppRwy in dfAd02RunwaysOppFilter.iterrows():
-                            if oppRwy.any:
-                                xmlMapsRunwayThreshOpp.set('Name', str(oppEnd))
-                                xmlMapsRunwayThreshOpp.set('Position', oppRwy['location'])
-                    else:
-                        print(Fore.RED + "No opposite runway for " + rwy['runway'] + " at " + row['icao_designator'] + Style.RESET_ALL)
-                        xmlMapsRunwayThreshOpp.set('Name', str(oppEnd))
-                        oppDist = int(rwy['length']) / 1000 # get runway distance in KM
-                        dmsExplode = re.search(r'([+-]{1})([\d]{2})([\d]{2})([\d]{2}\.[\d]{2})([+-]{1})([\d]{3})([\d]{2})([\d]{2}\.[\d]{2})', rwy['location'])
-                        lat = Point.parse_degrees(dmsExplode.group(2), dmsExplode.group(3), dmsExplode.group(4), Geo.northSouth(dmsExplode.group(1)))
-                        lon = Point.parse_degrees(dmsExplode.group(6), dmsExplode.group(7), dmsExplode.group(8), Geo.eastWest(dmsExplode.group(5)))
-                        oppCoord = geodesic(kilometers=oppDist).destination(Point(lat, lon), rwy['bearing']).format_decimal()
-                        splt = oppCoord.split(', ')
-                        p = Point(splt[0], splt[1])
-                        dmsFormat = p.format(deg_char='', min_char='', sec_char='')
-                        dmsSplit = dmsFormat.split()
-
-                        def splitRound(floatIn):
-                            roundIt = round(float(floatIn), 2)
-                            splitIt = str(roundIt).split('.')
-                            buildIt = str(splitIt[0]).zfill(2) + "." + splitIt[1]
-                            return buildIt
-
-                        roundLat = splitRound(dmsSplit[2])
-                        roundLon = splitRound(dmsSplit[6])
-                        space = Geo.plusMinus(dmsSplit[3].rstrip(',')) + dmsSplit[0].zfill(2) + dmsSplit[1].zfill(2) + str(roundLat) + Geo.plusMinus(dmsSplit[7]) + dmsSplit[4].zfill(3) + dmsSplit[5].zfill(2) + str(roundLon)
-
-                        xmlMapsRunwayThreshOpp.set('Position', space)
-
-                    # create map points and titles
-                    xmlMapsRunwayPointsLabels = self.constructMapHeader(xmlMapsRunway, 'System', row['icao_designator'] + '_TWR_RWY_' + rwy['runway'] + '_NAMES', '2', rwy['location'])
-                    xmlMapsRunwayPointsLabelsL = xtree.SubElement(xmlMapsRunwayPointsLabels, 'Label')
-                    xmlMapsRunwayPoints = xtree.SubElement(xmlMapsRunwayPointsLabels, 'Symbol')
-                    xmlMapsRunwayPoints.set('Type', 'HollowStar')
-                    for point in mapPoint:
-                        self.elementPoint(xmlMapsRunwayPoints, point)
-                        self.elementPoint(xmlMapsRunwayPointsLabelsL, point)
-
-                    # create folder structure if not exists
-                    filename = 'Build/Maps/' + row['icao_designator'] + '/' + row['icao_designator'] + '_TWR_RWY_' + rwy['runway'] + '.xml'
-                    os.makedirs(os.path.dirname(filename), exist_ok=True)
-                    self.buildPrettyXml(xmlMapsRunway, filename)
-
-
-                    # add runway into the airspace.xml file
-                    xmlAirportRunway = xtree.SubElement(xmlAirport, 'Runway')
-                    xmlAirportRunway.set('Name', rwy['runway'])
-                    xmlAirportRunway.set('Position', rwy['location'])
-
                 bar()
 
         # Construct the XML element as per https://virtualairtrafficsystem.com/docs/dpk/#intersections
@@ -706,10 +1225,11 @@ class Builder:
         with alive_bar(barLength) as bar: # Define the progress bar
             print("Constructing XML for ENR 2 CTA Data")
             for index, row in dfEnr02Cta.iterrows():
-                xmlCta = xtree.SubElement(allCta, 'Line')
-                xmlCta.set('Name', row['name'])
-                xmlCta.set('Pattern', 'Dashed')
-                xmlCta.text = row['boundary'].rstrip('/')
+                for suffix, tolerance in Simplify.levels: # one map per level of detail
+                    xmlCta = xtree.SubElement(allCta[suffix], 'Line')
+                    xmlCta.set('Name', row['name'])
+                    xmlCta.set('Pattern', 'Dashed')
+                    xmlCta.text = Simplify.boundary(row['boundary'].rstrip('/'), tolerance)
 
                 bar()
 
@@ -720,10 +1240,11 @@ class Builder:
         with alive_bar(barLength) as bar: # Define the progress bar
             print("Constructing XML for ENR 2 TMA Data")
             for index, row in dfEnr02Tma.iterrows():
-                xmlTma = xtree.SubElement(allTma, 'Line')
-                xmlTma.set('Name', row['name'])
-                xmlTma.set('Pattern', 'Dashed')
-                xmlTma.text = row['boundary'].rstrip('/')
+                for suffix, tolerance in Simplify.levels: # one map per level of detail
+                    xmlTma = xtree.SubElement(allTma[suffix], 'Line')
+                    xmlTma.set('Name', row['name'])
+                    xmlTma.set('Pattern', 'Dashed')
+                    xmlTma.text = Simplify.boundary(row['boundary'].rstrip('/'), tolerance)
 
                 bar()
 
@@ -746,12 +1267,208 @@ class Builder:
         addAirway(10)
 
         # Write all XML files
-        self.buildPrettyXml(allAirports[2], "Build/Maps/ALL_AIRPORTS.xml")
-        self.buildPrettyXml(allCta, "Build/Maps/ALL_CTA.xml")
-        self.buildPrettyXml(allTma, "Build/Maps/ALL_TMA.xml")
-        self.buildPrettyXml(allNavaids[3], "Build/Maps/ALL_NAVAIDS.xml")
-        self.buildPrettyXml(airspace[5], "Build/Airspace.xml")
+        self.writeXml(allAirports[2], "Build/Maps/ALL_AIRPORTS.xml", self.inputsDigest([0]))
+        for suffix, tolerance in Simplify.levels:
+            self.writeXml(allCta[suffix], "Build/Maps/ALL_CTA" + suffix + ".xml", self.inputsDigest([6]))
+            self.writeXml(allTma[suffix], "Build/Maps/ALL_TMA" + suffix + ".xml", self.inputsDigest([7]))
+        self.writeXml(allNavaids[3], "Build/Maps/ALL_NAVAIDS.xml", self.inputsDigest([11, 12]))
+        self.writeXml(airspace[5], "Build/Airspace.xml", self.inputsDigest(range(len(self.scrape)), ["Navigraph/sids.txt", "Navigraph/stars.txt"]))
+        self.manifest.finish()
+
+    def mapAerodromes(self, tasks):
+        # Run buildAerodrome over every task, in a pool of processes unless only one job was asked for
+        if self.jobs == 1:
+            yield from map(self.buildAerodrome, tasks)
+            return
+
+        with ProcessPoolExecutor(max_workers=self.jobs, mp_context=Scheduler.processContext()) as executor:
+            yield from executor.map(self.buildAerodrome, tasks, chunksize=4)
+
+    @staticmethod
+    def oppositeEnd(runway): # works out the designator for the other end of a runway, e.g. 08L -> 26R
+        oppEndSplit = re.match(r'([\d]{2})([L|R|C])?', runway)
+        if int(oppEndSplit.group(1)) < 18:
+            oppEnd = int(oppEndSplit.group(1)) + 18
+        else:
+            oppEnd = int(oppEndSplit.group(1)) - 18
+
+        if oppEndSplit.group(2):
+            if oppEndSplit.group(2) == "L":
+                oppEnd = str(oppEnd).zfill(2) + "R"
+            elif oppEndSplit.group(2) == "R":
+                oppEnd = str(oppEnd).zfill(2) + "L"
+            elif oppEndSplit.group(2) == "C":
+                oppEnd = str(oppEnd).zfill(2) + "C"
+        else:
+            oppEnd = str(oppEnd).zfill(2)
+
+        return oppEnd
 
+    @staticmethod
+    @Stage.timed
+    def buildSyntheticThresholds(runwaysByIcao):
+        # Some runways only have one end listed in the eAIP, so place the other threshold one runway length down the bearing
+        # All of them are solved together in a single call and reported back as a list of dicts
+        missing = []
+        for icao, runways in runwaysByIcao.items():
+            designators = {rwy['runway'] for rwy in runways}
+            for rwy in runways:
+                oppEnd = Builder.oppositeEnd(rwy['runway'])
+                if oppEnd not in designators:
+                    missing.append((icao, rwy, oppEnd))
+
+        if not missing:
+            return []
+
+        lat, lon = Dms.parse([rwy['location'] for icao, rwy, oppEnd in missing])
+        bearing = np.array([float(rwy['bearing']) for icao, rwy, oppEnd in missing])
+        length = np.array([float(rwy['length']) for icao, rwy, oppEnd in missing]) # metres
+        oppLon, oppLat, backAzimuth = Geo.geod.fwd(lon, lat, bearing, length)
+
+        synthesised = []
+        for (icao, rwy, oppEnd), position in zip(missing, Dms.format(oppLat, oppLon)):
+            print(Fore.RED + "No opposite runway for " + rwy['runway'] + " at " + icao + ", synthesised " + oppEnd + " at " + position + Style.RESET_ALL)
+            synthesised.append({'icao_designator': icao, 'runway': oppEnd, 'from': rwy['runway'], 'position': position})
+
+        return synthesised
+
+    @staticmethod
+    @Stage.timed
+    def buildAerodrome(task):
+        # Build the runway maps for one aerodrome and return the parts that belong in Airspace.xml
+        # This runs in a worker process when building in parallel so it only works on what it is given
+        row, runways, synthetic, previous = task
+        print(Fore.BLUE + "Constructing XML for " + row['icao_designator'] + " ("+ row['name'] +")" + Style.RESET_ALL)
+        # set airport name (icao) under Airspace/SystemRunways
+        xmlAerodrome = xtree.Element('Airport')
+        xmlAerodrome.set('Name',row['icao_designator'])
+        # set airport name (icao) under Airspace/Airports
+        xmlAirport = xtree.Element('Airport')
+        xmlAirport.set('ICAO', row['icao_designator'])
+        xmlAirport.set('Position', row['location'])
+        xmlAirport.set('Elevation', str(row['elevation']))
+        xmlSidStars = [] # SID and STAR elements for Airspace/SIDSTARs
+        outputs = [] # (file, digest of its inputs, whether it was written) for every runway map
+
+        # Index this aerodrome's runways by designator so each threshold pairing is a lookup
+        runwayEnds = {}
+        for rwy in runways:
+            runwayEnds[rwy['runway']] = rwy
+
+        for rwy in runways: # all runways that belong to this aerodrome
+            xmlRunway = xtree.SubElement(xmlAerodrome, 'Runway')
+            xmlRunway.set('Name', rwy['runway'])
+            xmlRunway.set('DataRunway', rwy['runway'])
+
+            # create XML maps for each runway
+            #figure out the other end of the runway first
+            oppEnd = Builder.oppositeEnd(rwy['runway'])
+
+            xmlMapsRunway = Builder.root('Maps')
+            xmlMapsRunwayMap = Builder.constructMapHeader(xmlMapsRunway, 'System', row['icao_designator'] + '_TWR_RWY_' + rwy['runway'], '1', rwy['location'])
+            xmlMapsRunwayMapRwy = xtree.SubElement(xmlMapsRunwayMap, 'Runway')
+            xmlMapsRunwayMapRwy.set('Name', rwy['runway'])
+            xmlMapsRunwayThresh = xtree.SubElement(xmlMapsRunwayMapRwy, 'Threshold')
+            xmlMapsRunwayThresh.set('Name', rwy['runway'])
+            xmlMapsRunwayThresh.set('Position', rwy['location'])
+            centreLineTrack = Geo.backBearing(rwy['bearing'])
+            xmlMapsRunwayThresh.set('ExtendedCentrelineTrack', str(centreLineTrack))
+            xmlMapsRunwayThresh.set('ExtendedCentrelineLength', "10")
+            xmlMapsRunwayThresh.set('ExtendedCentrelineTickInterval', "1")
+            xmlMapsRunwayThreshOpp = xtree.SubElement(xmlMapsRunwayMapRwy, 'Threshold')
+
+            # add SIDs into the runway map
+            mapPoint = set() # create a set to store all SID/STAR waypoints for this aerodrome
+            sids = Navigraph.sidStar("Navigraph/sids.txt", row['icao_designator'], rwy['runway'])
+
+            xmlMapsRunwaySid = Builder.constructMapHeader(xmlMapsRunway, 'System', row['icao_designator'] + '_TWR_RWY_' + rwy['runway'] + "_SID", '1', rwy['location'])
+            for sid in sids:
+                xmlMapsRunwayLine = xtree.SubElement(xmlMapsRunwaySid, 'Line')
+                xmlMapsRunwayLine.text = sid['Route']
+
+                sidSplit = sid['Route'].split('/')
+                for point in sidSplit:
+                    mapPoint.add(point)
+
+            for sid in sids:
+                xmlSid = xtree.SubElement(xmlRunway, 'SID')
+                xmlSid.set('Name', sid['Name'])
+
+                xmlSidStarSid = xtree.Element('SID')
+                xmlSidStars.append(xmlSidStarSid)
+                xmlSidStarSid.set('Name', sid['Name'])
+                xmlSidStarSid.set('Airport', sid['ICAO'])
+                xmlSidStarSid.set('Runways', sid['Runway'])
+
+                xmlRoute = xtree.SubElement(xmlSidStarSid, 'Route')
+                xmlRoute.set('Runway', sid['Runway'])
+                slashToSpace = sid['Route'].replace('/', ' ')
+                xmlRoute.text = slashToSpace
+
+            # add STARs into the runway map
+            stars = Navigraph.sidStar("Navigraph/stars.txt", row['icao_designator'], rwy['runway'])
+
+            xmlMapsRunwayStar = Builder.constructMapHeader(xmlMapsRunway, 'System', row['icao_designator'] + '_TWR_RWY_' + rwy['runway'] + "_STAR", '1', rwy['location'])
+            for star in stars:
+                xmlMapsRunwayLine = xtree.SubElement(xmlMapsRunwayStar, 'Line')
+                xmlMapsRunwayLine.set('Pattern', 'Dotted')
+                xmlMapsRunwayLine.text = star['Route']
+
+                starSplit = star['Route'].split('/')
+                for point in starSplit:
+                    mapPoint.add(point)
+
+            for star in stars:
+                xmlSid = xtree.SubElement(xmlRunway, 'STAR')
+                xmlSid.set('Name', star['Name'])
+
+                xmlSidStarStar = xtree.Element('STAR')
+                xmlSidStars.append(xmlSidStarStar)
+                xmlSidStarStar.set('Name', star['Name'])
+                xmlSidStarStar.set('Airport', star['ICAO'])
+                xmlSidStarStar.set('Runways', star['Runway'])
+
+                xmlRoute = xtree.SubElement(xmlSidStarStar, 'Route')
+                xmlRoute.set('Runway', star['Runway'])
+                slashToSpace = star['Route'].replace('/', ' ')
+                xmlRoute.text = slashToSpace
+
+            oppRwy = runwayEnds.get(oppEnd) # find the threshold at the other end of this runway
+
+            xmlMapsRunwayThreshOpp.set('Name', oppEnd)
+            if oppRwy is not None:
+                xmlMapsRunwayThreshOpp.set('Position', oppRwy['location'])
+            else:
+                xmlMapsRunwayThreshOpp.set('Position', synthetic[oppEnd]) # solved up front in buildSyntheticThresholds
+
+            # create map points and titles
+            xmlMapsRunwayPointsLabels = Builder.constructMapHeader(xmlMapsRunway, 'System', row['icao_designator'] + '_TWR_RWY_' + rwy['runway'] + '_NAMES', '2', rwy['location'])
+            xmlMapsRunwayPointsLabelsL = xtree.SubElement(xmlMapsRunwayPointsLabels, 'Label')
+            xmlMapsRunwayPoints = xtree.SubElement(xmlMapsRunwayPointsLabels, 'Symbol')
+            xmlMapsRunwayPoints.set('Type', 'HollowStar')
+            for point in mapPoint:
+                Builder.elementPoint(xmlMapsRunwayPoints, point)
+                Builder.elementPoint(xmlMapsRunwayPointsLabelsL, point)
+
+            # only rewrite the map if something it is built from has changed since the last build
+            filename = 'Build/Maps/' + row['icao_designator'] + '/' + row['icao_designator'] + '_TWR_RWY_' + rwy['runway'] + '.xml'
+            digest = Manifest.digest([row['icao_designator'], rwy, xmlMapsRunwayThreshOpp.get('Position'), sids, stars])
+            written = previous.get(filename) != digest or not os.path.exists(filename)
+            if written:
+                # create folder structure if not exists
+                os.makedirs(os.path.dirname(filename), exist_ok=True)
+                Builder.buildPrettyXml(xmlMapsRunway, filename)
+            outputs.append((filename, digest, written))
+
+
+            # add runway into the airspace.xml file
+            xmlAirportRunway = xtree.SubElement(xmlAirport, 'Runway')
+            xmlAirportRunway.set('Name', rwy['runway'])
+            xmlAirportRunway.set('Position', rwy['location'])
+
+        return [xmlAerodrome, xmlSidStars, xmlAirport, outputs]
+
+    @Stage.timed
     def buildAirspaceXml(self):
         xmlAirspace = self.root('Airspace') # create XML document Airspace.xml
 
@@ -764,6 +1481,7 @@ class Builder:
 
         return [xmlSystemRunways, xmlSidStar, xmlIntersections, xmlAirports, xmlAirways, xmlAirspace]
 
+    @Stage.timed
     def buildMapsAllAirportsXml(self):
         # create XML document Maps\ALL_AIRPORTS
         xmlAllAirports = self.root('Maps')
@@ -777,6 +1495,7 @@ class Builder:
 
         return [xmlAllAirportsLabel, xmlAllAirportsSymbol, xmlAllAirports]
 
+    @Stage.timed
     def buildMapsAllNavaidsXml(self):
         # create XML document Maps\ALL_NAVAIDS
         xmlAllNavaids = self.root('Maps')
@@ -793,13 +1512,19 @@ class Builder:
 
         return [xmlAllNavaidsLabel, xmlAllNavaidsSymbol, xmlAllNavaidsSymbolH, xmlAllNavaids]
 
+    @Stage.timed
     def buildOtherTopLevelMaps(self, mapName, priority):
         xmlRoot = self.root('Maps')
         xmlMap = self.constructMapHeader(xmlRoot, 'System', mapName, priority, self.mapCentre)
 
         return xmlMap
 
+    @Stage.timed
     def buildRestrictedAreas(self):
+        digest = self.inputsDigest([13])
+        if self.unchanged('Build/RestrictedAreas.xml', digest):
+            return
+
         xmlRestrictedAreas = self.root("RestrictedAreas")
         xmlAreas = xtree.SubElement(xmlRestrictedAreas, "Areas")
 
@@ -824,26 +1549,9 @@ class Builder:
                 if slash in row['boundary']:
                     xmlBoundary.text = row['boundary']
                 else:
-                    space = ''
-                    dmsExplode = re.search(r'([+-]{1})([\d]{2})([\d]{2})([\d]{2}\.[\d]{2})([+-]{1})([\d]{3})([\d]{2})([\d]{2}\.[\d]{2})', row['boundary'])
-                    lat = Point.parse_degrees(dmsExplode.group(2), dmsExplode.group(3), dmsExplode.group(4), Geo.northSouth(dmsExplode.group(1)))
-                    lon = Point.parse_degrees(dmsExplode.group(6), dmsExplode.group(7), dmsExplode.group(8), Geo.eastWest(dmsExplode.group(5)))
-                    circle = Geo.geodesic_point_buffer(lat, lon, 3.0)
-                    for c in circle:
-                        p = Point(c[1], c[0])
-                        dmsFormat = p.format(deg_char='', min_char='', sec_char='')
-                        dmsSplit = dmsFormat.split()
-
-                        def splitRound(floatIn):
-                            roundIt = round(float(floatIn), 2)
-                            splitIt = str(roundIt).split('.')
-                            buildIt = str(splitIt[0]).zfill(2) + "." + splitIt[1]
-                            return buildIt
-
-                        roundLat = splitRound(dmsSplit[2])
-                        roundLon = splitRound(dmsSplit[6])
-                        space += Geo.plusMinus(dmsSplit[3].rstrip(',')) + dmsSplit[0].zfill(2) + dmsSplit[1].zfill(2) + str(roundLat) + Geo.plusMinus(dmsSplit[7]) + dmsSplit[4].zfill(3) + dmsSplit[5].zfill(2) + str(roundLon) + '/'
-                    xmlBoundary.text = space.rstrip('/')
+                    lat, lon = Dms.parse(row['boundary'])
+                    circle = np.array(Geo.geodesic_point_buffer(float(lat[0]), float(lon[0]), 3.0))
+                    xmlBoundary.text = '/'.join(Dms.format(circle[:, 1], circle[:, 0]))
 
                 xmlActivations = xtree.SubElement(xmlArea, "Activations")
                 xmlActivation = xtree.SubElement(xmlActivations, "Activation")
@@ -853,9 +1561,14 @@ class Builder:
 
                 bar()
 
-        self.buildPrettyXml(xmlRestrictedAreas, 'Build/RestrictedAreas.xml')
+        self.writeXml(xmlRestrictedAreas, 'Build/RestrictedAreas.xml', digest)
 
+    @Stage.timed
     def buildPositions(self):
+        digest = self.inputsDigest([0])
+        if self.unchanged('Build/Positions.xml', digest):
+            return
+
         # Load the services data to build Positions.xml
         aerodromeList = self.scrape[0]
         #servicesCsv = self.scrape[2].sort_values(by=['icao_designator', 'callsign_type'])
@@ -1042,8 +1755,9 @@ class Builder:
                 xmlPositionMap.set("Name", row['icao_designator'] + '/' + row['icao_designator'] + '_SMR_HLD')
                 bar()
 
-        self.buildPrettyXml(xmlPositions, 'Build/Positions.xml')
+        self.writeXml(xmlPositions, 'Build/Positions.xml', digest)
 
+    @Stage.timed
     def buildSectors(self): # creates the frequency secion of ATIS.xml, Sectors.xml
         def myround(x, base=0.025): # rounds to the nearest 25KHz - simulator limitations prevent 8.33KHz spacing currently
             flt = float(x)
@@ -1062,6 +1776,10 @@ class Builder:
             elif callSignType == "DELIVERY":
                 return "_DEL"
 
+        digest = self.inputsDigest([0, 2])
+        if self.unchanged('Build/Sectors.xml', digest):
+            return
+
         xmlSectors = self.root("Sectors")
         lastType = ''
 
@@ -1101,7 +1819,7 @@ class Builder:
                 lastType = row['callsign_type']
                 bar()
 
-            self.buildPrettyXml(xmlSectors, 'Build/Sectors.xml')
+            self.writeXml(xmlSectors, 'Build/Sectors.xml', digest)
 
     @staticmethod
     def root(name):
@@ -1115,11 +1833,68 @@ class Builder:
 
         return xml
 
+    def inputsDigest(self, frames, files=()):
+        # frames are positions in self.scrape, files are any other files read while building
+        return Manifest.digest([self.frameDigests[i] for i in frames] + [Manifest.fileDigest(f) for f in files])
+
+    def unchanged(self, fileOut, digest):
+        # True (and the file is kept as it is) if none of its inputs have changed since the last build
+        if self.manifest.unchanged(fileOut, digest):
+            self.manifest.record(fileOut, digest, False)
+            return True
+        return False
+
+    def writeXml(self, rootIn, fileOut, digest):
+        if not self.unchanged(fileOut, digest):
+            self.buildPrettyXml(rootIn, fileOut)
+            self.manifest.record(fileOut, digest, True)
+
     @staticmethod
+    @Stage.timed
     def buildPrettyXml(rootIn, fileOut):
-        xmlstr = minidom.parseString(xtree.tostring(rootIn)).toprettyxml(indent="   ")
+        # Stream the tree straight to file, laid out exactly as minidom's toprettyxml(indent="   ") would
         with open(fileOut, "w") as f:
-            f.write(xmlstr)
+            f.write('<?xml version="1.0" ?>\n')
+            Builder.writeElement(f.write, rootIn, "")
+            Metrics.count('bytes_written', f.tell())
+        Metrics.count('xml_elements', sum(1 for element in rootIn.iter()))
+
+    @staticmethod
+    def writeElement(write, element, indent):
+        write(indent + "<" + element.tag)
+        for name, value in element.items():
+            write(" " + name + "=\"" + Builder.escapeXml(value) + "\"")
+
+        text = Builder.normaliseText(element.text)
+        if len(element) == 0:
+            if text:
+                write(">" + Builder.escapeXml(text) + "</" + element.tag + ">\n") # a lone text node stays on the same line
+            else:
+                write("/>\n")
+            return
+
+        childIndent = indent + "   "
+        write(">\n")
+        if text:
+            write(Builder.escapeXml(childIndent + text + "\n"))
+        for child in element:
+            Builder.writeElement(write, child, childIndent)
+            tail = Builder.normaliseText(child.tail)
+            if tail:
+                write(Builder.escapeXml(childIndent + tail + "\n"))
+        write(indent + "</" + element.tag + ">\n")
+
+    @staticmethod
+    def normaliseText(text):
+        # An xml parser hands back line endings as \n only
+        if text:
+            return text.replace("\r\n", "\n").replace("\r", "\n")
+        return text
+
+    @staticmethod
+    def escapeXml(data):
+        data = str(data) # pykml hands back objectified elements rather than plain strings
+        return data.replace("&", "&amp;").replace("<", "&lt;").replace("\"", "&quot;").replace(">", "&gt;")
 
     @staticmethod
     def constructMapHeader(rootName, mapType, name, priority, center): # ref https://virtualairtrafficsystem.com/docs/dpk/#map-element
@@ -1143,17 +1918,19 @@ class Builder:
 class Geo:
     '''Class to store various geo tools'''
 
+    geod = pyproj.Geod(ellps='WGS84')
+
     @staticmethod
-    def geodesic_point_buffer(lat, lon, km):
-        proj_wgs84 = pyproj.Proj('+proj=longlat +ellps=WGS84 +datum=WGS84 +no_defs')
-        # Azimuthal equidistant projection
-        aeqd_proj = '+proj=aeqd +lat_0={lat} +lon_0={lon} +x_0=0 +y_0=0'
-        project = partial(
-            pyproj.transform,
-            pyproj.Proj(aeqd_proj.format(lat=lat, lon=lon)),
-            proj_wgs84)
-        buf = sPoint(0, 0).buffer(km * 1000)  # distance in metres
-        return transform(project, buf).exterior.coords[:]
+    @Stage.timed
+    @lru_cache(maxsize=None)
+    def geodesic_point_buffer(lat, lon, km, vertices=64):
+        # Ring of points km from the centre, solved in one call and remembered for repeat centres
+        # Starts due east and runs clockwise to match the shapely buffer it replaced, closing back on the first point
+        azimuths = 90 + np.arange(vertices) * (360 / vertices)
+        lons, lats, backAzimuths = Geo.geod.fwd(np.full(vertices, float(lon)), np.full(vertices, float(lat)), azimuths, np.full(vertices, km * 1000))
+        ring = list(zip(lons.tolist(), lats.tolist()))
+        ring.append(ring[0])
+        return tuple(ring)
 
     @staticmethod
     def northSouth(arg): # Turns a compass point into the correct + or - for lat and long
@@ -1184,15 +1961,10 @@ class Geo:
     @staticmethod
     def kmlMappingConvert(fileIn, icao): # BUG: needs reworking
         def mapLabels():
-            # code to generate the map labels.
-            points = MultiPoint(latLonString) # function to calculate polygon centroid
-            labelPoint = points.centroid
-            labelPrint = re.sub(r'[A-Z()]', '', str(labelPoint))
-            labelSplit = labelPrint.split()
-
+            # code to generate the map labels, placed on the centroid of the polygon points
             xmlGroundMapInfLabelPoint = xtree.SubElement(xmlGroundMapInfLabel, 'Point')
             xmlGroundMapInfLabelPoint.set('Name', splitName[1])
-            xmlGroundMapInfLabelPoint.text = "+" + str(labelSplit[0]) + re.sub(r'-0\.', '-000.', labelSplit[1])
+            xmlGroundMapInfLabelPoint.text = Dms.formatDecimal([lat.mean()], [lon.mean()])[0]
 
         self.icao = icao
 
@@ -1223,14 +1995,9 @@ class Geo:
             else:
                 coords = pm.Polygon.outerBoundaryIs.LinearRing.coordinates
 
-            search = re.finditer(r'([+|-]{1})([\d]{1}\.[\d]{10,20}),([\d]{2}\.[\d]{10,20})', str(coords))
-            output = ''
-            latLonString = []
+            lat, lon = Dms.fromKml(coords)
+            output = '/'.join(Dms.formatDecimal(*Simplify.points(lat, lon, Simplify.smr)))
             print(name)
-            for line in search:
-                fullLon = line.group().split(',')
-                output += "+" + str(line.group(3)) + str(line.group(1)) + "00" + str(line.group(2)) + "/"
-                latLonString.append((float(line.group(3)),float(fullLon[0])))
 
             if splitName[0] == "Rwy":
                 xmlGroundInfill = xtree.SubElement(xmlGroundMapRwy, 'Infill')
@@ -1249,16 +2016,57 @@ class Geo:
                 mapLabels()
 
             xmlGroundInfill.set('Name', name)
-            xmlGroundInfill.text = output.rstrip('/')
+            xmlGroundInfill.text = output
 
         Builder.buildPrettyXml(xmlGround, 'Build/Maps/'+ self.icao + '_SMR.xml')
 
 
 class Navigraph:
+    '''Class to look up SIDs and STARs from the Navigraph procedure files'''
+
+    indexes = {} # procedure files that have already been parsed this run, keyed by file name
+    indexVersion = 1 # bump this when the layout of the parsed procedures changes
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def fingerprint():
+        # A change to the parser, or to what it produces, throws away every parsed copy kept on disk
+        return Manifest.digest([Navigraph.indexVersion, inspect.getsource(Navigraph.parse)])
+
+    @staticmethod
+    @Stage.timed
     def sidStar(file, icaoIn, rwyIn):
-        dfColumns=['ICAO','Runway','Name','Route']
-        df = pd.DataFrame(columns=dfColumns)
-        #print(df.to_string())
+        # Return the list of procedures for the given aerodrome and runway
+        return Navigraph.index(file).get((icaoIn, rwyIn), [])
+
+    @staticmethod
+    @Stage.timed
+    def index(file):
+        # Parse a procedure file once into {(icao, runway): [procedure, ...]}
+        # The parsed copy is kept next to the file and reused until the file or the parser is modified
+        mtime = os.path.getmtime(file)
+        if file in Navigraph.indexes and Navigraph.indexes[file][0] == mtime:
+            return Navigraph.indexes[file][1]
+
+        indexFile = file + ".pickle"
+        procedures = None
+        if os.path.exists(indexFile):
+            with open(indexFile, 'rb') as f:
+                stored = pickle.load(f)
+            if stored.get('fingerprint') == Navigraph.fingerprint() and stored.get('mtime') == mtime:
+                procedures = stored['procedures']
+
+        if procedures is None:
+            procedures = Navigraph.parse(file)
+            with open(indexFile, 'wb') as f:
+                pickle.dump({'fingerprint': Navigraph.fingerprint(), 'mtime': mtime, 'procedures': procedures}, f)
+
+        Navigraph.indexes[file] = (mtime, procedures)
+        return procedures
+
+    @staticmethod
+    def parse(file):
+        procedures = {}
         with open(file, 'r') as text:
             content = text.read() # read everything
             aerodromeData = re.split(r'\[', content) # split by [
@@ -1266,70 +2074,111 @@ class Navigraph:
                 aerodromeIcao = re.search(r'([A-Z]{4})(\]\n)', data) # get the ICAO aerodrome designator
                 if aerodromeIcao:
                     icao = aerodromeIcao.group(1)
-                    if icao == icaoIn:
-                        lineSearch = re.findall(r'(T[\s]+)([A-Z\d]{5,})([\s]+[A-Z\d]{5,}[\s]+)([\d]{2}[L|R|C]?)(\,.*)?\n', data)
+                    lineSearch = re.findall(r'(T[\s]+)([A-Z\d]{5,})([\s]+[A-Z\d]{5,}[\s]+)([\d]{2}[L|R|C]?)(\,.*)?\n', data)
 
-                        if lineSearch:
-                            for line in lineSearch:
-                                srdRunway = line[3]
+                    if lineSearch:
+                        for line in lineSearch:
+                            srdRunway = line[3]
 
-                                # for each SID, get the route
-                                routeSearch = re.findall(rf'^({line[1]})\s+([\dA-Z]{{3,5}})', data, re.M)
+                            # for each SID, get the route
+                            routeSearch = re.findall(rf'^({line[1]})\s+([\dA-Z]{{3,5}})', data, re.M)
 
-                                if routeSearch:
-                                    concatRoute = ''
-                                    for route in routeSearch:
-                                        concatRoute += route[1] + "/"
-                                        routeName = route[0]
+                            if routeSearch:
+                                concatRoute = ''
+                                for route in routeSearch:
+                                    concatRoute += route[1] + "/"
+                                    routeName = route[0]
 
-                                    if line[4]:
-                                        starRunways = line[4].split(',')
-                                        for rwy in starRunways:
-                                            dfOut = {'ICAO': icao, 'Runway': rwy, 'Name': routeName, 'Route': concatRoute.rstrip('/')}
-                                            df = df.append(dfOut, ignore_index=True)
+                                runways = []
+                                if line[4]:
+                                    runways = line[4].split(',')
+                                runways.append(srdRunway)
 
-                                    dfOut = {'ICAO': icao, 'Runway': srdRunway, 'Name': routeName, 'Route': concatRoute.rstrip('/')}
-                                    df = df.append(dfOut, ignore_index=True)
+                                for rwy in runways:
+                                    procedure = {'ICAO': icao, 'Runway': rwy, 'Name': routeName, 'Route': concatRoute.rstrip('/')}
+                                    procedures.setdefault((icao, rwy), []).append(procedure)
 
-            return df[(df.Runway == rwyIn)]
+        return procedures
 
 class ValidateXml:
-    """docstring for ValidateXml."""
-
-    def __init__(self, schema):
-        with open(schema) as sFile:
-            self.schema = xmlschema.XMLSchema(sFile)
-
-    def validateDir(self, searchDir, matchFile):
-        with alive_bar() as bar:
-            for subdir, dirs, files in os.walk(searchDir):
-                for filename in files:
-                    filepath = subdir + os.sep + filename
-                    if fnmatch.fnmatch(filename, matchFile + '.xml'):
-                        bar()
-                        if self.schema.is_valid(filepath) is False:
-                            print(filepath)
-                            self.schema.validate(filepath)
+    '''Class to validate the built xml files against the vatSys XSD schemas'''
 
-        print(Fore.GREEN + "    OK" + Style.RESET_ALL + " - All tests passed for " + searchDir + matchFile)
+    schemas = {} # compiled schemas, each XSD is only compiled once per process
+
+    # (schema, search directory, filename match) for every group of files to validate
+    checks = [
+        ("Validation/twrmap.xsd", "Build/Maps", "*TWR*"),
+        ("Validation/airspace.xsd", "Build", "Airspace"),
+        ("Validation/radars.xsd", "Build", "Radars"),
+        ("Validation/sectors.xsd", "Build", "Sectors"),
+        ("Validation/allmaps.xsd", "Build/Maps", "ALL_*"),
+    ]
 
     @staticmethod
-    def run():
-        # Validation of XML files with XSD schema
-        twrMap = ValidateXml("Validation/twrmap.xsd")
-        twrMap.validateDir("Build/Maps", "*TWR*")
+    def schema(xsd):
+        if xsd not in ValidateXml.schemas:
+            with open(xsd) as sFile:
+                ValidateXml.schemas[xsd] = xmlschema.XMLSchema(sFile)
+        return ValidateXml.schemas[xsd]
 
-        airspace = ValidateXml("Validation/airspace.xsd")
-        airspace.validateDir("Build", "Airspace")
+    @staticmethod
+    def findFiles(searchDir, matchFile):
+        found = []
+        for subdir, dirs, files in os.walk(searchDir):
+            for filename in files:
+                if fnmatch.fnmatch(filename, matchFile + '.xml'):
+                    found.append(subdir + os.sep + filename)
+        return sorted(found)
 
-        radar = ValidateXml("Validation/radars.xsd")
-        radar.validateDir("Build", "Radars")
+    @staticmethod
+    @Stage.timed
+    def validateFile(task):
+        # Parse the file once and collect every error rather than stopping at the first
+        xsd, filepath = task
+        errors = []
+        try:
+            for error in ValidateXml.schema(xsd).iter_errors(filepath):
+                errors.append({'path': error.path, 'reason': error.reason})
+        except (xmlschema.XMLResourceError, xtree.ParseError, OSError) as error:
+            # a file that can't be read or parsed fails on its own without stopping the rest
+            errors.append({'path': None, 'reason': str(error)})
+        return {'file': filepath, 'schema': xsd, 'errors': errors}
 
-        sectors = ValidateXml("Validation/sectors.xsd")
-        sectors.validateDir("Build", "Sectors")
+    @staticmethod
+    @Stage.timed
+    def run(workers=None, files=None):
+        # Validation of XML files with XSD schema, spread across a pool of processes
+        # files limits validation to those paths, e.g. only what an incremental build rewrote
+        if files is not None:
+            files = {os.path.normpath(filepath) for filepath in files}
+        tasks = []
+        for xsd, searchDir, matchFile in ValidateXml.checks:
+            found = ValidateXml.findFiles(searchDir, matchFile)
+            if files is not None:
+                found = [filepath for filepath in found if os.path.normpath(filepath) in files]
+            tasks += [(xsd, filepath) for filepath in found]
+
+        report = []
+        with alive_bar(len(tasks)) as bar:
+            # workers start from a fresh interpreter, so each compiles the schemas it needs once
+            with ProcessPoolExecutor(max_workers=workers, mp_context=Scheduler.processContext()) as executor:
+                for result in executor.map(ValidateXml.validateFile, tasks, chunksize=8):
+                    report.append(result)
+                    Metrics.count('files_invalid' if result['errors'] else 'files_validated')
+                    bar()
+
+        for xsd, searchDir, matchFile in ValidateXml.checks:
+            failed = [result for result in report if result['schema'] == xsd and result['errors']]
+            if failed:
+                print(Fore.RED + "  FAIL" + Style.RESET_ALL + " - " + str(len(failed)) + " file(s) failed for " + searchDir + matchFile)
+                for result in failed:
+                    print("    " + result['file'])
+                    for error in result['errors']:
+                        print("      " + str(error['path']) + ": " + str(error['reason']))
+            else:
+                print(Fore.GREEN + "    OK" + Style.RESET_ALL + " - All tests passed for " + searchDir + matchFile)
 
-        allMaps = ValidateXml("Validation/allmaps.xsd")
-        allMaps.validateDir("Build/Maps", "ALL_*")
+        return report
 
 class EuroScope:
     """tools to convert EuroScope bits to vatSys"""
@@ -1337,45 +2186,21 @@ class EuroScope:
     def __init__(self, icao):
         self.icao = icao
         # get the location of this aerodrome
-        df = pd.read_csv('Dataframes/Ad01.csv', index_col=0)
+        df = Store().read('Ad01', columns=['icao_designator', 'location'])
         dfLookup = df.loc[df['icao_designator'] == icao]
-        self.location = dfLookup.iat[0,2]
+        self.location = dfLookup.iat[0,1]
 
     def kmlMappingConvert(self, fileIn, fileNumber):
         def mapLabels():
-            # code to generate the map labels.
-            points = MultiPoint(latLonString) # function to calculate polygon centroid
-            labelPoint = points.centroid
-            labelPrint = re.sub(r'[A-Z()]', '', str(labelPoint))
-            labelSplit = labelPrint.split()
-
-            if labelSplit:
+            # code to generate the map labels, placed on the centroid of the polygon points
+            if len(lat):
                 xmlGroundMapInfLabelPoint = xtree.SubElement(xmlGroundMapInfLabel, 'Point')
                 xmlGroundMapInfLabelPoint.set('Name', child)
-                if float(labelSplit[0]) > 0:
-                    dotSplit = str(labelSplit[0]).split(".")
-                    latPrint = "+" + str(dotSplit[0]).zfill(2) + "." + str(dotSplit[1])
-                else:
-                    dotSplit = str(labelSplit[0]).split(".")
-                    dotStart = str(dotSplit[0]).lstrip("-")
-                    latPrint = "-" + str(dotStart).zfill(2) + "." + str(dotSplit[1])
-
-                if float(labelSplit[1]) > 0:
-                    dotSplit = str(labelSplit[1]).split(".")
-                    lonPrint = "+" + str(dotSplit[0]).zfill(3) + "." + str(dotSplit[1])
-                else:
-                    dotSplit = str(labelSplit[1]).split(".")
-                    dotStart = str(dotSplit[0]).lstrip("-")
-                    lonPrint = "-" + str(dotStart).zfill(3) + "." + str(dotSplit[1])
-
-                xmlGroundMapInfLabelPoint.text = str(latPrint) + str(lonPrint)
+                xmlGroundMapInfLabelPoint.text = Dms.formatDecimal([lat.mean()], [lon.mean()])[0]
 
         xmlGround = Builder.root('Ground')
         xmlGroundMap = xtree.SubElement(xmlGround, 'Maps')
 
-        with open(fileIn) as fobj:
-            folder = parser.parse(fobj).getroot().Document
-
         xmlGroundMapRwy = Builder.constructMapHeader(xmlGroundMap, 'Ground_RWY', self.icao + '_SMR_RWY', '1', self.location)
         xmlGroundMapTwy = Builder.constructMapHeader(xmlGroundMap, 'Ground_TWY', self.icao + '_SMR_TWY', '2', self.location)
         xmlGroundMapBld = Builder.constructMapHeader(xmlGroundMap, 'Ground_BLD', self.icao + '_SMR_BLD', '1', self.location)
@@ -1389,160 +2214,196 @@ class EuroScope:
         xmlGroundMapInfLabel.set('Alignment', 'Center')
         xmlGroundMapInfLabel.set('VerticalAlignment', 'Middle')
 
-        try:
-            rootFolder = folder.Folder.Folder
-        except:
-            rootFolder = folder.Folder
-
-        for pm in rootFolder:
-            name = pm.name
-            print(" " + name)
-            titles = ["apron","aprons","asphalt","backround","backrounds","buildings","concrete","grass","ground","holding","holds","island","land","markings","new","parking","runway","runways","stand","stands","surface","taxi","taxilines","taxiway","taxiways","other"]
-            splitName = str(name).split()
-            if splitName[0].lower() in titles:
-                try:
-                    pmP = pm.Folder.Placemark
-                except:
-                    try:
-                        pmP = pm.Placemark
-                    except:
-                        pass
-
-                for place in pmP:
-                    try:
-                        coords = place.LineString.coordinates
-                    except:
-                        coords = place.Polygon.outerBoundaryIs.LinearRing.coordinates
-
-                    child = place.name
-                    print("  " + str(child))
-                    search = re.finditer(r'([+|-]?)([\d]{1,3})\.([\d]{10,20}),([+|-]?)([\d]{1,2})\.([\d]{10,20})', str(coords))
-                    output = ''
-                    latLonString = []
-
-                    for line in search:
-                        if line.group(1) == "-":
-                            lonSign = "-"
-                        else:
-                            lonSign = "+"
+        titles = ["apron","aprons","asphalt","backround","backrounds","buildings","concrete","grass","ground","holding","holds","island","land","markings","new","parking","runway","runways","stand","stands","surface","taxi","taxilines","taxiway","taxiways","other"]
+        placemarks = 0
+        for folders, child, kind, lat, lon in Kml.placemarks(fileIn):
+            # the placemark belongs to the outermost folder that names a layer, e.g. Runways or Taxiways
+            name = next((folder for folder in folders if folder.split() and folder.split()[0].lower() in titles), None)
+            if name is None:
+                continue
+            splitName = name.split()
+            placemarks += 1
+            output = '/'.join(Dms.formatDecimal(*Simplify.points(lat, lon, Simplify.smr)))
+
+            if name.lower() == "runways" or name.lower() == "runway" or splitName[-1].lower() == "runways":
+                xmlGroundInfill = xtree.SubElement(xmlGroundMapRwy, 'Infill')
+                mapLabels()
+                xmlGroundInfill.set('Name', child)
+                xmlGroundInfill.text = output
+            elif splitName[0].lower() == "taxiways" or splitName[0].lower() == "taxi" or splitName[0].lower() == "taxilines" or splitName[0].lower() == "taxiway" or splitName[-1].lower() == "taxiways":
+                xmlGroundInfill = xtree.SubElement(xmlGroundMapTwy, 'Infill')
+                mapLabels()
+                xmlGroundInfill.set('Name', child)
+                xmlGroundInfill.text = output
+            elif splitName[0].lower() == "buildings":
+                xmlGroundInfill = xtree.SubElement(xmlGroundMapBld, 'Infill')
+                xmlGroundInfill.set('Name', child)
+                xmlGroundInfill.text = output
+            elif splitName[0].lower() == "aprons" or splitName[-1] == "aprons":
+                xmlGroundInfill = xtree.SubElement(xmlGroundMapApr, 'Infill')
+                xmlGroundInfill.set('Name', child)
+                xmlGroundInfill.text = output
+            elif splitName[0].lower() == "background" or splitName[0].lower() == "backgrounds":
+                xmlGroundInfill = xtree.SubElement(xmlGroundMapBak, 'Infill')
+                xmlGroundInfill.set('Name', child)
+                xmlGroundInfill.text = output
+            elif splitName[0].lower() == "surface" or splitName[0].lower() == "markings" or splitName[-1].lower() == "markings" or splitName[-1].lower() == "lines" or splitName[0].lower() == "hold" or splitName[0].lower() == "holding" or splitName[0].lower() == "holds" or splitName[0].lower() == "stand" or splitName[0].lower() == "stands":
+                xmlGroundInfill = xtree.SubElement(xmlGroundMapHld, 'Line')
+                mapLabels()
+                xmlGroundInfill.set('Name', child)
+                xmlGroundInfill.text = output
 
-                        if line.group(4) == "-":
-                            latSign = "-"
-                        else:
-                            latSign = "+"
-
-                        output += latSign + str(line.group(5)).zfill(2) + "." + str(line.group(6)) + lonSign + str(line.group(2)).zfill(3) + "." + str(line.group(3)) + "/"
-                        lineSplit = line.group().split(",")
-                        latLonString.append((float(lineSplit[1]),float(lineSplit[0])))
-
-                    if str(name).lower() == "runways" or str(name).lower() == "runway" or splitName[-1].lower() == "runways":
-                        xmlGroundInfill = xtree.SubElement(xmlGroundMapRwy, 'Infill')
-                        mapLabels()
-                        xmlGroundInfill.set('Name', child)
-                        xmlGroundInfill.text = output.rstrip('/')
-                    elif splitName[0].lower() == "taxiways" or splitName[0].lower() == "taxi" or splitName[0].lower() == "taxilines" or splitName[0].lower() == "taxiway" or splitName[-1].lower() == "taxiways":
-                        xmlGroundInfill = xtree.SubElement(xmlGroundMapTwy, 'Infill')
-                        mapLabels()
-                        xmlGroundInfill.set('Name', child)
-                        xmlGroundInfill.text = output.rstrip('/')
-                    elif splitName[0].lower() == "buildings":
-                        xmlGroundInfill = xtree.SubElement(xmlGroundMapBld, 'Infill')
-                        xmlGroundInfill.set('Name', child)
-                        xmlGroundInfill.text = output.rstrip('/')
-                    elif splitName[0].lower() == "aprons" or splitName[-1] == "aprons":
-                        xmlGroundInfill = xtree.SubElement(xmlGroundMapApr, 'Infill')
-                        xmlGroundInfill.set('Name', child)
-                        xmlGroundInfill.text = output.rstrip('/')
-                    elif splitName[0].lower() == "background" or splitName[0].lower() == "backgrounds":
-                        xmlGroundInfill = xtree.SubElement(xmlGroundMapBak, 'Infill')
-                        xmlGroundInfill.set('Name', child)
-                        xmlGroundInfill.text = output.rstrip('/')
-                    elif splitName[0].lower() == "surface" or splitName[0].lower() == "markings" or splitName[-1].lower() == "markings" or splitName[-1].lower() == "lines" or splitName[0].lower() == "hold" or splitName[0].lower() == "holding" or splitName[0].lower() == "holds" or splitName[0].lower() == "stand" or splitName[0].lower() == "stands":
-                        xmlGroundInfill = xtree.SubElement(xmlGroundMapHld, 'Line')
-                        mapLabels()
-                        xmlGroundInfill.set('Name', child)
-                        xmlGroundInfill.text = output.rstrip('/')
+        print(" " + self.icao + ": " + str(placemarks) + " placemarks")
 
         if str(fileNumber) == "1":
-            Builder.buildPrettyXml(xmlGround, 'Build/Maps/'+ self.icao + '/' + self.icao + '_SMR.xml')
+            fileOut = 'Build/Maps/'+ self.icao + '/' + self.icao + '_SMR.xml'
         else:
-            Builder.buildPrettyXml(xmlGround, 'KML/SMR/' + self.icao + '_' + str(fileNumber) + '_SMR.xml')
+            fileOut = 'KML/SMR/' + self.icao + '_' + str(fileNumber) + '_SMR.xml'
+        os.makedirs(os.path.dirname(fileOut), exist_ok=True)
+        Builder.buildPrettyXml(xmlGround, fileOut)
+        return fileOut
 
     @staticmethod
     def parse(fileIn):
         dfColumns = ['sectorline','coords']
-        df = pd.DataFrame(columns=dfColumns)
+        df = Accumulator(dfColumns)
         file = open(fileIn, "r")
         #fileWrite = open('Testing/out.txt', "w")
-        c = ''
+        c = []
         for f in file:
-            coord = re.search(r"(N|S)([\d]{3})\.([\d]{2})\.([\d]{2})(\.[\d]{3})[\s|:](E|W)([\d]{3})\.([\d]{2})\.([\d]{2})(\.[\d]{3})", f)
+            coord = re.search(r"(N|S)([\d]{3})\.([\d]{2})\.([\d]{2}\.[\d]{3})[\s|:](E|W)([\d]{3})\.([\d]{2})\.([\d]{2}\.[\d]{3})", f)
             line = re.search(r"(SECTORLINE):(.*)", f)
             if coord:
-                latSign = Geo.plusMinus(coord.group(1))
-                lonSign = Geo.plusMinus(coord.group(6))
-
-                output = latSign + coord.group(2).lstrip("0") + coord.group(3) + coord.group(4)  + coord.group(5) + lonSign + coord.group(7) + coord.group(8) + coord.group(9)  + coord.group(10)
-                c += output + '/'
+                c.append(coord.groups())
             elif line:
                 lineOut = line.group(2)
             elif f == "\n":
-                dfOut = {'sectorline': lineOut, 'coords': c.rstrip('/')}
-                df = df.append(dfOut, ignore_index=True)
-                c = ''
-
+                # convert the whole sector line in one go, EuroScope gives seconds to 3dp
+                parts = np.array(c, dtype=str).reshape(-1, 8)
+                lat = Dms.fromParts(parts[:, 0], parts[:, 1], parts[:, 2], parts[:, 3])
+                lon = Dms.fromParts(parts[:, 4], parts[:, 5], parts[:, 6], parts[:, 7])
+                dfOut = {'sectorline': lineOut, 'coords': '/'.join(Dms.format(lat, lon, 3))}
+                df.append(dfOut)
+                c = []
+
+        df = df.frame()
         print(df)
         df.to_csv('Dataframes/ES-SectorLines.csv')
 
     @staticmethod
-    def iterFolders(src, dst):
+    def findKmz(src):
+        # (icao, kmz file, number) for every KMZ in an aerodrome folder such as .../EGKK/EGKK.kmz, numbered within each aerodrome
+        tasks = []
         for subdir, dirs, files in os.walk(rf'{src}'):
-            c = 0
-            for filename in files:
-                filepath = subdir + os.sep + filename
-                if filepath.endswith(".kmz"):
-                    splitPath = subdir.split('/')
-                    splitName = filename.split('.')
-                    if re.match(r'(EG)[A-Z]{2}', splitPath[-1]) is not None:
-                        c += 1
-                        copyDst = dst + splitPath[-1] + "_" + str(c) + '.zip'
-                        shutil.copyfile(filepath, copyDst)
-                        with zipfile.ZipFile(copyDst, 'r') as zip:
-                            print(splitPath[-1])
-                            zip.extractall(dst)
-                            shutil.copyfile(dst + 'doc.kml', dst + splitPath[-1] + "_" + str(c) + '.kml')
-                            try:
-                                convert = EuroScope(splitPath[-1])
-                                kmlFileIn = dst + splitPath[-1] + "_" + str(c) + '.kml'
-                                convert.kmlMappingConvert(kmlFileIn, c)
-                            except:
-                                print("ERROR: " + splitPath[-1])
+            dirs.sort()
+            icao = os.path.basename(os.path.normpath(subdir))
+            if re.match(r'(EG)[A-Z]{2}', icao) is None:
+                continue
+            kmz = sorted(filename for filename in files if filename.endswith(".kmz"))
+            for c, filename in enumerate(kmz, start=1):
+                tasks.append((icao, subdir + os.sep + filename, c))
+        return tasks
+
+    @staticmethod
+    def convertKmz(task):
+        # Converts the KML inside a KMZ straight from the archive, nothing is extracted to disk
+        icao, filepath, c = task
+        result = {'icao': icao, 'file': filepath, 'number': c, 'output': None, 'error': None}
+        try:
+            with zipfile.ZipFile(filepath, 'r') as kmz:
+                names = [name for name in kmz.namelist() if name.lower().endswith('.kml')]
+                if not names:
+                    raise ValueError("no KML in the archive")
+                # Google Earth always calls the main document doc.kml
+                kmlName = 'doc.kml' if 'doc.kml' in names else names[0]
+                with kmz.open(kmlName) as kml:
+                    result['output'] = EuroScope(icao).kmlMappingConvert(kml, c)
+        except Exception as error:
+            result['error'] = type(error).__name__ + ": " + str(error)
+        return result
+
+    @staticmethod
+    def iterFolders(src, workers=None):
+        # Converts every aerodrome KMZ under src, spread across a pool of processes
+        tasks = EuroScope.findKmz(src)
+        report = []
+        with alive_bar(len(tasks)) as bar:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=Scheduler.processContext()) as executor:
+                for result in executor.map(EuroScope.convertKmz, tasks):
+                    report.append(result)
+                    bar()
+
+        failed = [result for result in report if result['error']]
+        if failed:
+            print(Fore.RED + "  FAIL" + Style.RESET_ALL + " - " + str(len(failed)) + " of " + str(len(report)) + " KMZ file(s) could not be converted")
+            for result in failed:
+                print("    " + result['file'])
+                print("      " + result['error'])
+        else:
+            print(Fore.GREEN + "    OK" + Style.RESET_ALL + " - " + str(len(report)) + " KMZ file(s) converted")
+
+        return report
 
 # Defuse XML
 defuse_stdlib()
 
-# Build command line argument parser
-cmdParse = argparse.ArgumentParser(description="Application to collect data from an AIRAC source and build that into xml files for use with vatSys.")
-cmdParse.add_argument('-s', '--scrape', help='web scrape and build xml files', action='store_true')
-cmdParse.add_argument('-b', '--build', help='build xml file from database', action='store_true')
-cmdParse.add_argument('-g', '--geo', help='tool to assist with converting airport mapping from ES', action='store_true')
-cmdParse.add_argument('-d', '--debug', help='runs the code defined in the debug section [DEV ONLY]', action='store_true')
-cmdParse.add_argument('-v', '--verbose', action='store_true')
-args = cmdParse.parse_args()
-
-if args.geo:
-    EuroScope.iterFolders('/mnt/c/Users/chris/OneDrive/Git Repo/UK-Sector-File/_data/SMR Files/', '/mnt/c/Users/chris/OneDrive/Git Repo/uk-dataset/ConversionTools/KML/ZIP/')
-elif args.debug:
-    EuroScope.parse('/mnt/c/Users/chris/OneDrive/Git Repo/UK-Sector-File/Sectors/Combined.txt')
-elif args.scrape:
-    shutil.rmtree('/mnt/c/Users/chris/OneDrive/Git Repo/uk-dataset/ConversionTools/Build')
-    os.mkdir('/mnt/c/Users/chris/OneDrive/Git Repo/uk-dataset/ConversionTools/Build')
-    new = Builder()
-    new.run()
-    ValidateXml.run()
-elif args.build:
-    shutil.rmtree('/mnt/c/Users/chris/OneDrive/Git Repo/uk-dataset/ConversionTools/Build')
-    os.mkdir('/mnt/c/Users/chris/OneDrive/Git Repo/uk-dataset/ConversionTools/Build')
-    new = Builder(1)
-    new.run()
-    ValidateXml.run()
+if __name__ == '__main__':
+    # Build command line argument parser
+    cmdParse = argparse.ArgumentParser(description="Application to collect data from an AIRAC source and build that into xml files for use with vatSys.")
+    cmdParse.add_argument('-s', '--scrape', help='web scrape and build xml files', action='store_true')
+    cmdParse.add_argument('-b', '--build', help='build xml file from database', action='store_true')
+    cmdParse.add_argument('-g', '--geo', help='tool to assist with converting airport mapping from ES', action='store_true')
+    cmdParse.add_argument('-d', '--debug', help='runs the code defined in the debug section [DEV ONLY]', action='store_true')
+    cmdParse.add_argument('-v', '--verbose', action='store_true')
+    cmdParse.add_argument('-w', '--workers', help='number of eAIP pages to download at once', type=int, default=8)
+    cmdParse.add_argument('--delay', help='minimum number of seconds between requests to the eAIP server', type=float, default=0.1)
+    cmdParse.add_argument('--cache', help='directory to keep downloaded eAIP pages in', default='Cache')
+    cmdParse.add_argument('--offline', help='only use eAIP pages that are already in the cache', action='store_true')
+    cmdParse.add_argument('--timeout', help='seconds to wait for the eAIP server before retrying a request', type=float, default=30)
+    cmdParse.add_argument('--stages', help='number of eAIP sections to parse at once, always 1 with --memory or --pstats', type=int, default=4)
+    cmdParse.add_argument('--resume', help='skip any eAIP section that has already been parsed for this AIRAC cycle', action='store_true')
+    cmdParse.add_argument('-j', '--jobs', help='number of processes to use, defaults to one per CPU', type=int)
+    cmdParse.add_argument('-i', '--incremental', help='only rewrite the files in Build whose inputs have changed', action='store_true')
+    cmdParse.add_argument('--profile', help='time every stage and write the results to this json file', nargs='?', const='Profile/stages.json')
+    cmdParse.add_argument('--pstats', help='with --profile, also dump cProfile stats for every stage next to the json file', action='store_true')
+    cmdParse.add_argument('--memory', help='trace the memory every stage peaks at and holds on to and write it to this json file (slows the run down)', nargs='?', const='Profile/memory.json')
+    cmdParse.add_argument('--metrics', help='write counts and rates for every stage to this json lines file')
+    cmdParse.add_argument('--prometheus', help='keep this Prometheus textfile collector file up to date with the same metrics')
+    args = cmdParse.parse_args()
+
+    if args.profile:
+        Stage.start((os.path.dirname(args.profile) or ".") if args.pstats else None)
+        atexit.register(Stage.report, args.profile) # also reports when a failed validation exits early
+    if args.memory:
+        Memory.start()
+        atexit.register(Memory.report, args.memory)
+    if args.metrics or args.prometheus:
+        Metrics.start(args.metrics, args.prometheus)
+        atexit.register(Metrics.finish)
+    if (args.memory or (args.profile and args.pstats)) and args.stages != 1:
+        # traced memory peaks are for the whole process and cProfile follows one thread, so neither can tell stages running side by side apart
+        print(Fore.YELLOW + "Parsing one eAIP section at a time so every stage is traced on its own" + Style.RESET_ALL)
+        args.stages = 1
+
+    if args.geo:
+        report = EuroScope.iterFolders('/mnt/c/Users/chris/OneDrive/Git Repo/UK-Sector-File/_data/SMR Files/', args.jobs)
+        if any(result['error'] for result in report):
+            sys.exit(1)
+    elif args.debug:
+        EuroScope.parse('/mnt/c/Users/chris/OneDrive/Git Repo/UK-Sector-File/Sectors/Combined.txt')
+    elif args.scrape or args.build:
+        if not args.incremental:
+            shutil.rmtree('/mnt/c/Users/chris/OneDrive/Git Repo/uk-dataset/ConversionTools/Build')
+            os.mkdir('/mnt/c/Users/chris/OneDrive/Git Repo/uk-dataset/ConversionTools/Build')
+        if args.scrape:
+            new = Builder(webscrape=Webscrape(workers=args.workers, delay=args.delay, cacheDir=args.cache, offline=args.offline, stageWorkers=args.stages, resume=args.resume, jobs=args.jobs, timeout=args.timeout), jobs=args.jobs)
+        else:
+            new = Builder(1, jobs=args.jobs)
+        new.run()
+        # unchanged files were validated when they were written
+        report = ValidateXml.run(args.jobs, new.manifest.written)
+        failed = [result['file'] for result in report if result['errors']]
+        if failed:
+            new.manifest.forget(failed)
+            new.manifest.save()
+            sys.exit(1)
@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+
+import cProfile
+import fnmatch
+import functools
+import json
+import os
+import sys
+import threading
+import tracemalloc
+from time import perf_counter, thread_time, time, ctime
+from colorama import Fore, Style
+
+class Stage:
+    '''Class to time the stages of a run, use as "with Stage(name):" or decorate a function with @Stage.timed'''
+
+    enabled = False # nothing is recorded, and the hooks cost next to nothing, until start() is called
+    pid = None # only the process that called start() records anything, worker processes it forks carry on as normal
+    profileDir = None # where cProfile stats are dumped for each stage, None to skip them
+    records = {} # totals for every stage, keyed by name
+    profiles = {} # one cProfile.Profile per stage when profileDir is set
+    lock = threading.Lock()
+    local = threading.local() # each thread has its own stack of open stages
+
+    # the stages a run is made up of, as opposed to the helpers they call over and over
+    main = ["Webscrape.run", "Webscrape.parse*", "Builder.run", "Builder.build*", "Builder.mapAerodromes", "ValidateXml.run", "EuroScope.iterFolders"]
+    helpers = ["Builder.buildPrettyXml", "Builder.buildAerodrome", "Webscrape.parseAd02Page"] # once per file written or per aerodrome
+
+    def __init__(self, name):
+        self.name = name
+
+    @staticmethod
+    def start(profileDir=None):
+        Stage.enabled = True
+        Stage.pid = os.getpid()
+        Stage.profileDir = profileDir
+        Stage.records = {}
+        Stage.profiles = {}
+
+    @staticmethod
+    def stack():
+        if not hasattr(Stage.local, 'stack'):
+            Stage.local.stack = []
+        return Stage.local.stack
+
+    @staticmethod
+    def isMain(name):
+        return any(fnmatch.fnmatch(name, pattern) for pattern in Stage.main) and name not in Stage.helpers
+
+    @staticmethod
+    def active():
+        return Stage.enabled and os.getpid() == Stage.pid
+
+    def __enter__(self):
+        if not Stage.active():
+            return self
+        stack = Stage.stack()
+        if Stage.profileDir is not None and threading.current_thread() is threading.main_thread():
+            # only one profiler can run at a time, so the enclosing stage hands over to this one until it is done
+            if stack and stack[-1].profiler is not None:
+                stack[-1].profiler.disable()
+            with Stage.lock:
+                self.profiler = Stage.profiles.setdefault(self.name, cProfile.Profile())
+            self.profiler.enable()
+        else:
+            self.profiler = None
+        if Memory.enabled and threading.current_thread() is threading.main_thread():
+            Memory.stageStarted(self, stack[-1] if stack else None)
+        else:
+            self.memory = None
+        stack.append(self)
+        if Metrics.enabled:
+            Metrics.stageStarted(self)
+        self.wall = perf_counter()
+        self.cpu = thread_time()
+        return self
+
+    def __exit__(self, *exc):
+        if not Stage.active() or not Stage.stack() or Stage.stack()[-1] is not self:
+            return False
+        wall = perf_counter() - self.wall
+        cpu = thread_time() - self.cpu
+        stack = Stage.stack()
+        stack.pop()
+        if self.profiler is not None:
+            self.profiler.disable()
+            if stack and stack[-1].profiler is not None:
+                stack[-1].profiler.enable()
+        with Stage.lock:
+            record = Stage.records.setdefault(self.name, {'calls': 0, 'wall': 0.0, 'cpu': 0.0})
+            record['calls'] += 1
+            record['wall'] += wall
+            record['cpu'] += cpu
+        if self.memory is not None:
+            Memory.stageFinished(self, stack[-1] if stack else None)
+        if Metrics.enabled:
+            Metrics.stageFinished(self, wall, cpu)
+        return False
+
+    @staticmethod
+    def timed(func):
+        # Records every call to func as a stage named after it, e.g. Builder.buildSectors
+        name = func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not Stage.active():
+                return func(*args, **kwargs)
+            with Stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    @staticmethod
+    def report(fileOut=None):
+        # Prints the stages slowest first, writes them to fileOut as json and dumps the cProfile stats alongside
+        stages = sorted(Stage.records.items(), key=lambda item: -item[1]['wall'])
+        print("\n{:<45}{:>8}{:>12}{:>12}{:>12}".format("Stage", "Calls", "Wall (s)", "CPU (s)", "Per call"))
+        for name, record in stages:
+            print("{:<45}{:>8}{:>12.3f}{:>12.3f}{:>12.5f}".format(name, record['calls'], record['wall'], record['cpu'], record['wall'] / record['calls']))
+        print("Times include any stages run inside them, CPU time is for the calling thread only so work in worker processes is not counted")
+
+        if Stage.profileDir is not None:
+            os.makedirs(Stage.profileDir, exist_ok=True)
+            for name, profiler in Stage.profiles.items():
+                profiler.dump_stats(os.path.join(Stage.profileDir, name + ".pstats"))
+
+        if fileOut:
+            os.makedirs(os.path.dirname(fileOut) or ".", exist_ok=True)
+            with open(fileOut, "w") as f:
+                json.dump({'generated': ctime(time()), 'stages': dict(stages)}, f, indent=2)
+            print(Fore.GREEN + "Stage timings written to " + fileOut + Style.RESET_ALL)
+
+class Metrics:
+    '''Class to count what each stage gets through, e.g. pages fetched or rows parsed, for runs with nobody watching the progress bars'''
+
+    enabled = False
+    logFile = None # json lines, one line as each top level stage starts and ends plus a progress line every interval
+    promFile = None # Prometheus textfile collector format, rewritten as the run goes
+    prefix = "uk_dataset_"
+    interval = 10 # seconds between progress updates while counts are coming in
+    counters = {} # {stage: {counter: value}}, counted against the innermost stage running on that thread
+    totals = {} # {counter: value} for the whole run
+    running = [] # logged stages that have started but not finished
+    started = 0
+    lastProgress = 0
+    lastWrite = 0
+    lock = threading.Lock()
+    writeLock = threading.Lock() # the textfile can be rewritten from any thread that counts something
+
+    @staticmethod
+    def start(logFile=None, promFile=None):
+        Stage.enabled = True
+        Stage.pid = os.getpid()
+        Metrics.enabled = True
+        Metrics.logFile = logFile
+        Metrics.promFile = promFile
+        Metrics.counters = {}
+        Metrics.totals = {}
+        Metrics.running = []
+        Metrics.started = Metrics.lastProgress = time()
+        for fileOut in (logFile, promFile):
+            if fileOut:
+                os.makedirs(os.path.dirname(fileOut) or ".", exist_ok=True)
+        if logFile:
+            open(logFile, "w").close()
+        Metrics.log({'event': 'start'})
+        Metrics.writeTextfile()
+
+    @staticmethod
+    def count(counter, value=1):
+        # Adds value to counter for whichever stage is running, counter names are snake_case, e.g. pages_fetched
+        if not Metrics.enabled or not Stage.active():
+            return
+        stack = Stage.stack()
+        stage = stack[-1].name if stack else "main"
+        now = time()
+        with Metrics.lock:
+            stageCounters = Metrics.counters.setdefault(stage, {})
+            stageCounters[counter] = stageCounters.get(counter, 0) + value
+            Metrics.totals[counter] = Metrics.totals.get(counter, 0) + value
+            Metrics.lastProgress = now
+            due = now - Metrics.lastWrite >= Metrics.interval
+            if due:
+                Metrics.lastWrite = now
+                progress = {'event': 'progress', 'stage': Metrics.running[-1].name if Metrics.running else "main", 'totals': dict(Metrics.totals)}
+        if due:
+            Metrics.log(progress)
+            Metrics.writeTextfile()
+
+    @staticmethod
+    def stageStarted(stage):
+        # only the main stages get their own log lines, everything else is still counted against the stage it runs in
+        # a main stage running on another thread, e.g. a scrape stage the scheduler runs alongside others, is logged as long as it is the outermost stage on that thread
+        if not Stage.isMain(stage.name):
+            return
+        if threading.current_thread() is not threading.main_thread() and Stage.stack()[0] is not stage:
+            return
+        with Metrics.lock:
+            stage.totals = dict(Metrics.totals)
+            Metrics.running.append(stage)
+        Metrics.log({'event': 'stage_start', 'stage': stage.name})
+        Metrics.writeTextfile()
+
+    @staticmethod
+    def stageFinished(stage, wall, cpu):
+        # Logs what was counted while the stage ran, including anything counted by stages and threads inside it
+        if stage not in Metrics.running:
+            return
+        with Metrics.lock:
+            Metrics.running.remove(stage)
+            counted = {counter: value - stage.totals.get(counter, 0) for counter, value in Metrics.totals.items() if value != stage.totals.get(counter, 0)}
+        rates = {counter + "_per_second": value / wall for counter, value in counted.items()} if wall > 0 else {}
+        line = {'event': 'stage_end', 'stage': stage.name, 'wall': wall, 'cpu': cpu, 'counters': counted, 'rates': rates}
+        if stage.memory is not None:
+            line['memory'] = {key: stage.memory[key] for key in ('peak', 'retained', 'rss')}
+        Metrics.log(line)
+        Metrics.writeTextfile()
+
+    @staticmethod
+    def log(line):
+        if not Metrics.logFile:
+            return
+        line = dict({'time': time()}, **line)
+        with Metrics.lock:
+            with open(Metrics.logFile, "a") as f:
+                f.write(json.dumps(line) + "\n")
+
+    @staticmethod
+    def label(value):
+        return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+    @staticmethod
+    def writeTextfile():
+        # The collector may read the file at any moment, so it is written alongside and moved into place
+        if not Metrics.promFile:
+            return
+        p = Metrics.prefix
+        with Metrics.lock:
+            counters = {stage: dict(values) for stage, values in Metrics.counters.items()}
+            running = [stage.name for stage in Metrics.running]
+        with Stage.lock:
+            records = {name: dict(record) for name, record in Stage.records.items()}
+
+        lines = []
+        names = sorted({counter for values in counters.values() for counter in values})
+        for counter in names:
+            lines.append("# TYPE " + p + counter + "_total counter")
+            for stage in sorted(counters):
+                if counter in counters[stage]:
+                    lines.append(p + counter + '_total{stage="' + Metrics.label(stage) + '"} ' + str(counters[stage][counter]))
+        lines.append("# TYPE " + p + "stage_seconds_total counter")
+        lines += [p + 'stage_seconds_total{stage="' + Metrics.label(name) + '"} ' + repr(record['wall']) for name, record in sorted(records.items())]
+        lines.append("# TYPE " + p + "stage_calls_total counter")
+        lines += [p + 'stage_calls_total{stage="' + Metrics.label(name) + '"} ' + str(record['calls']) for name, record in sorted(records.items())]
+        if Memory.enabled:
+            with Memory.lock:
+                memory = {name: dict(record) for name, record in Memory.records.items()}
+            lines.append("# TYPE " + p + "stage_peak_bytes gauge")
+            lines += [p + 'stage_peak_bytes{stage="' + Metrics.label(name) + '"} ' + str(record['peak']) for name, record in sorted(memory.items())]
+            lines.append("# TYPE " + p + "stage_rss_peak_bytes gauge")
+            lines += [p + 'stage_rss_peak_bytes{stage="' + Metrics.label(name) + '"} ' + str(record['rss']) for name, record in sorted(memory.items())]
+        lines.append("# TYPE " + p + "stage_running gauge")
+        lines += [p + 'stage_running{stage="' + Metrics.label(name) + '"} 1' for name in running]
+        lines.append("# TYPE " + p + "run_start_timestamp_seconds gauge")
+        lines.append(p + "run_start_timestamp_seconds " + repr(Metrics.started))
+        lines.append("# TYPE " + p + "last_progress_timestamp_seconds gauge")
+        lines.append(p + "last_progress_timestamp_seconds " + repr(Metrics.lastProgress))
+
+        with Metrics.writeLock:
+            with open(Metrics.promFile + ".tmp", "w") as f:
+                f.write("\n".join(lines) + "\n")
+            os.replace(Metrics.promFile + ".tmp", Metrics.promFile)
+
+    @staticmethod
+    def finish():
+        Metrics.log({'event': 'finish', 'wall': time() - Metrics.started, 'totals': dict(Metrics.totals)})
+        Metrics.writeTextfile()
+
+class Memory:
+    '''Class to track how much memory each stage peaks at and holds on to, from tracemalloc and the resident set size'''
+
+    enabled = False
+    top = 10 # allocation sites kept for each snapshot stage
+    interval = 0.05 # seconds between resident set size samples
+    records = {} # {stage: {'calls', 'peak', 'retained', 'rss', 'sites'}}
+    rssPeak = 0 # highest resident set size sampled since the last stage started or finished
+    lock = threading.Lock()
+    stopping = threading.Event()
+
+    @staticmethod
+    def start(frames=1):
+        Stage.enabled = True
+        Stage.pid = os.getpid()
+        Memory.enabled = True
+        Memory.records = {}
+        tracemalloc.start(frames)
+        Memory.rssPeak = Memory.rss()
+        Memory.stopping.clear()
+        threading.Thread(target=Memory.sample, name="Memory.sample", daemon=True).start()
+
+    @staticmethod
+    def rss():
+        # Resident set size in bytes, or the highest it has been if the current size can't be read
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError, AttributeError):
+            import resource
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak if sys.platform == 'darwin' else peak * 1024 # kB everywhere but macOS
+
+    @staticmethod
+    def sample():
+        while not Memory.stopping.wait(Memory.interval):
+            rss = Memory.rss()
+            with Memory.lock:
+                Memory.rssPeak = max(Memory.rssPeak, rss)
+
+    @staticmethod
+    def window():
+        # (traced now, traced peak, resident peak) since the last call, each stage boundary starts a new window
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        rss = Memory.rss()
+        with Memory.lock:
+            rssPeak = max(Memory.rssPeak, rss)
+            Memory.rssPeak = rss
+        return current, peak, rssPeak
+
+    @staticmethod
+    def stageStarted(stage, parent):
+        current, peak, rss = Memory.window()
+        if parent is not None and parent.memory is not None:
+            # the window that just closed belonged to the enclosing stage
+            parent.memory['peak'] = max(parent.memory['peak'], peak)
+            parent.memory['rss'] = max(parent.memory['rss'], rss)
+        stage.memory = {'start': current, 'peak': current, 'rss': rss, 'snapshot': None}
+        if Stage.isMain(stage.name):
+            # snapshots are slow, so only the main stages are compared for the allocation sites they leave behind
+            stage.memory['snapshot'] = tracemalloc.take_snapshot()
+
+    @staticmethod
+    def sites(before, after):
+        # Where the memory a stage held on to was allocated, biggest first
+        ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap*>")]
+        differences = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), 'lineno')
+        return [{'site': str(difference.traceback[0]), 'size': difference.size_diff, 'count': difference.count_diff} for difference in differences[:Memory.top] if difference.size_diff > 0]
+
+    @staticmethod
+    def stageFinished(stage, parent):
+        current, peak, rss = Memory.window()
+        memory = stage.memory
+        memory['peak'] = max(memory['peak'], peak)
+        memory['rss'] = max(memory['rss'], rss)
+        memory['retained'] = current - memory['start']
+        if parent is not None and parent.memory is not None:
+            # the enclosing stage was holding on to everything this stage used
+            parent.memory['peak'] = max(parent.memory['peak'], memory['peak'])
+            parent.memory['rss'] = max(parent.memory['rss'], memory['rss'])
+
+        sites = None
+        if memory['snapshot'] is not None:
+            sites = Memory.sites(memory['snapshot'], tracemalloc.take_snapshot())
+            memory['snapshot'] = None
+        with Memory.lock:
+            record = Memory.records.setdefault(stage.name, {'calls': 0, 'peak': 0, 'retained': 0, 'rss': 0, 'sites': []})
+            record['calls'] += 1
+            record['peak'] = max(record['peak'], memory['peak'])
+            record['retained'] += memory['retained']
+            record['rss'] = max(record['rss'], memory['rss'])
+            if sites is not None:
+                record['sites'] = sites
+
+    @staticmethod
+    def report(fileOut=None):
+        # Prints the stages with the highest peak first and the allocation sites behind the biggest ones
+        Memory.stopping.set()
+        megabyte = 1024 * 1024
+        stages = sorted(Memory.records.items(), key=lambda item: -item[1]['peak'])
+        print("\n{:<45}{:>8}{:>14}{:>14}{:>14}".format("Stage", "Calls", "Peak (MB)", "Retained (MB)", "RSS peak (MB)"))
+        for name, record in stages:
+            print("{:<45}{:>8}{:>14.1f}{:>14.1f}{:>14.1f}".format(name, record['calls'], record['peak'] / megabyte, record['retained'] / megabyte, record['rss'] / megabyte))
+        print("Peak and retained are Python allocations traced while the stage ran, including any stages inside it")
+
+        for name, record in stages:
+            if record['sites']:
+                print("\n" + name + " kept hold of:")
+                for site in record['sites'][:5]:
+                    print("  {:>10.1f} kB in {:>7} blocks  {}".format(site['size'] / 1024, site['count'], site['site']))
+
+        if fileOut:
+            os.makedirs(os.path.dirname(fileOut) or ".", exist_ok=True)
+            with open(fileOut, "w") as f:
+                json.dump({'generated': ctime(time()), 'rss_peak': max([record['rss'] for name, record in stages] + [Memory.rssPeak]), 'stages': dict(stages)}, f, indent=2)
+            print(Fore.GREEN + "Stage memory written to " + fileOut + Style.RESET_ALL)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+from lxml import etree
+from coordinates import Dms
+
+class Kml:
+    '''Class to stream the placemarks out of a KML file without building the whole tree'''
+
+    # {*} matches with or without the KML namespace
+    lineString = './/{*}LineString/{*}coordinates'
+    outerRing = './/{*}Polygon/{*}outerBoundaryIs//{*}coordinates'
+
+    @staticmethod
+    def coordinates(placemark):
+        # First LineString, or failing that the outer ring of the first Polygon, as (kind, coordinates text)
+        coords = placemark.find(Kml.lineString)
+        if coords is not None:
+            return 'LineString', coords.text or ''
+        coords = placemark.find(Kml.outerRing)
+        if coords is not None:
+            return 'Polygon', coords.text or ''
+        return None, None
+
+    @staticmethod
+    def placemarks(fileIn):
+        # Yields (folders, name, kind, lat, lon) for every placemark that has a line or polygon
+        # folders is the list of folder names from the outermost in, each placemark is cleared once it has been read
+        folders = [] # open Folder elements
+        names = [] # their names, filled in once the name has been read
+        context = etree.iterparse(fileIn, events=('start', 'end'), tag=('{*}Folder', '{*}Placemark'), resolve_entities=False, no_network=True, huge_tree=True)
+        for event, element in context:
+            isFolder = element.tag.endswith('Folder')
+            if event == 'start':
+                if isFolder:
+                    folders.append(element)
+                    names.append(None)
+                continue
+
+            # a folder's name comes before anything in it, so it has been read by the time the first child ends
+            for i, folder in enumerate(folders):
+                if names[i] is None:
+                    names[i] = (folder.findtext('{*}name') or '').strip()
+
+            if isFolder:
+                folders.pop()
+                names.pop()
+            else:
+                kind, text = Kml.coordinates(element)
+                if kind is not None:
+                    lat, lon = Dms.fromKml(text)
+                    yield list(names), (element.findtext('{*}name') or '').strip(), kind, lat, lon
+
+            # nothing further down the file needs what has already been read
+            element.clear()
+            parent = element.getparent()
+            while parent is not None and element.getprevious() is not None:
+                del parent[0]
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+import math
+import numpy as np
+from coordinates import Dms
+
+class Simplify:
+    '''Class to thin out the vertices of map lines with Douglas-Peucker, tolerances are in metres'''
+
+    # Levels of detail written for each simplified map layer as (suffix, tolerance in metres)
+    # e.g. ALL_CTA for wide range positions and ALL_CTA_HI for tower positions
+    levels = [('', 250.0), ('_HI', 25.0)]
+    smr = 0.5 # SMR polygons are only drawn close in, so just drop the points that sit on a straight edge
+
+    earthRadius = 6371008.8 # mean radius in metres
+    vectorise = 32 # spans with more vertices than this are measured with numpy
+
+    @staticmethod
+    def project(lat, lon):
+        # Sinusoidal projection about the middle of the line, distances are close to true over a few hundred km
+        lat = np.radians(np.asarray(lat, dtype=float))
+        lon = np.radians(np.asarray(lon, dtype=float))
+        centre = (lon.min() + lon.max()) / 2
+        x = Simplify.earthRadius * (lon - centre) * np.cos(lat)
+        y = Simplify.earthRadius * lat
+        return x, y
+
+    @staticmethod
+    def keep(lat, lon, tolerance):
+        # Returns a mask of the vertices to keep so that no dropped vertex is more than tolerance from the simplified line
+        count = len(lat)
+        if count < 3 or tolerance <= 0:
+            return np.ones(count, dtype=bool)
+
+        x, y = Simplify.project(lat, lon)
+        xs, ys = x.tolist(), y.tolist()
+        mask = np.zeros(count, dtype=bool)
+        mask[0] = mask[-1] = True
+        stack = [(0, count - 1)]
+        while stack:
+            first, last = stack.pop()
+            if last - first < 2:
+                continue
+            if last - first > Simplify.vectorise:
+                split, distance = Simplify.furthest(x, y, first, last)
+            else:
+                split, distance = Simplify.furthestShort(xs, ys, first, last)
+            if distance > tolerance:
+                mask[split] = True
+                stack.append((first, split))
+                stack.append((split, last))
+
+        closed = lat[0] == lat[-1] and lon[0] == lon[-1]
+        if closed and mask.sum() < 4:
+            # don't let a small polygon collapse into a line
+            return np.ones(count, dtype=bool)
+        return mask
+
+    @staticmethod
+    def furthest(x, y, first, last):
+        # The vertex between first and last that is furthest from the segment joining them, and how far away it is
+        dx = x[last] - x[first]
+        dy = y[last] - y[first]
+        px = x[first + 1:last] - x[first]
+        py = y[first + 1:last] - y[first]
+        length = dx * dx + dy * dy
+        if length > 0:
+            # distance to the segment rather than the whole line, closed rings start and end on the same point
+            t = np.clip((px * dx + py * dy) / length, 0, 1)
+            distance = np.hypot(px - t * dx, py - t * dy)
+        else:
+            distance = np.hypot(px, py)
+        furthest = int(np.argmax(distance))
+        return first + 1 + furthest, float(distance[furthest])
+
+    @staticmethod
+    def furthestShort(x, y, first, last):
+        # Same as furthest on plain lists, numpy costs more than it saves on a handful of vertices
+        dx = x[last] - x[first]
+        dy = y[last] - y[first]
+        length = dx * dx + dy * dy
+        split, furthest = first + 1, -1.0
+        for i in range(first + 1, last):
+            px = x[i] - x[first]
+            py = y[i] - y[first]
+            if length > 0:
+                t = min(max((px * dx + py * dy) / length, 0.0), 1.0)
+                px -= t * dx
+                py -= t * dy
+            distance = math.hypot(px, py)
+            if distance > furthest:
+                split, furthest = i, distance
+        return split, furthest
+
+    @staticmethod
+    def points(lat, lon, tolerance):
+        lat = np.asarray(lat, dtype=float)
+        lon = np.asarray(lon, dtype=float)
+        mask = Simplify.keep(lat, lon, tolerance)
+        return lat[mask], lon[mask]
+
+    @staticmethod
+    def boundary(text, tolerance):
+        # Simplifies a / separated vatSys boundary, the vertices that are kept are copied over exactly as they were
+        if tolerance <= 0:
+            return text
+        vertices = text.split('/')
+        try:
+            lat, lon = Dms.parse(vertices)
+        except ValueError:
+            return text # not something we can read, leave it alone
+        if len(lat) != len(vertices):
+            return text # e.g. an empty vertex
+        mask = Simplify.keep(lat, lon, tolerance)
+        return '/'.join(vertex for vertex, kept in zip(vertices, mask) if kept)
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+from coordinates import Dms
+
+def test_seconds_round_into_the_minute():
+    # 59.995" rounds to 60.00" which has to carry rather than be printed
+    lat = 51 + 10 / 60 + 59.995 / 3600
+    lon = -(1 + 59 / 60 + 59.999 / 3600)
+    assert Dms.format([lat], [lon]) == ["+511100.00-0020000.00"]
+
+def test_seconds_carry_through_the_degree():
+    lat = 51 + 59 / 60 + 59.996 / 3600
+    assert Dms.format([lat], [0.0]) == ["+520000.00+0000000.00"]
+
+def test_always_two_decimal_places():
+    lat, lon = Dms.parse("+524409.5+0040153.25")
+    assert Dms.format(lat, lon) == ["+524409.50+0040153.25"]
+
+def test_places():
+    lat, lon = [51.5], [-0.125]
+    assert Dms.format(lat, lon, 0) == ["+513000-0000730"]
+    assert Dms.format(lat, lon, 3) == ["+513000.000-0000730.000"]
+
+def test_negative_signs():
+    assert Dms.format([-0.5], [-1.25]) == ["-003000.00-0011500.00"]
+    assert Dms.format([-33.75], [151.5]) == ["-334500.00+1513000.00"]
+
+def test_degree_widths():
+    # latitude degrees are 2 digits and longitude 3, both zero padded
+    assert Dms.format([5.0], [5.0]) == ["+050000.00+0050000.00"]
+    assert Dms.format([89.5], [179.5]) == ["+893000.00+1793000.00"]
+
+def test_compass_signs():
+    values = Dms.fromCompass(["513000", "513000", "0013000", "0013000"], ["N", "S", "E", "W"])
+    assert values.tolist() == [51.5, -51.5, 1.5, -1.5]
+    values = Dms.fromParts(["N", "S", "+", "-"], ["51", "51", "1", "1"], ["30", "30", "30", "30"], ["0", "0", "0", "0"])
+    assert values.tolist() == [51.5, -51.5, 1.5, -1.5]
+
+def test_fromCompass_with_fractional_seconds():
+    assert Dms.fromCompass([510839.71], ["N"])[0] == pytest.approx(51 + 8 / 60 + 39.71 / 3600)
+
+def test_parse_round_trip():
+    text = "+511100.00-0020000.00/-334500.00+1513000.00/+050000.50+0050000.25"
+    lat, lon = Dms.parse(text)
+    assert '/'.join(Dms.format(lat, lon)) == text
+
+def test_parse_list_and_whole_seconds():
+    lat, lon = Dms.parse(["+513000-0013000", "+523000.5+0013000"])
+    assert lat.tolist() == pytest.approx([51.5, 52.5 + 0.5 / 3600])
+    assert lon.tolist() == pytest.approx([-1.5, 1.5])
+
+def test_parse_ignores_empty_vertices():
+    lat, lon = Dms.parse("+513000.00-0013000.00/")
+    assert lat.tolist() == [51.5] and lon.tolist() == [-1.5]
+    lat, lon = Dms.parse("")
+    assert len(lat) == 0 and len(lon) == 0
+
+@pytest.mark.parametrize("text", [
+    "+513000.00-0013000.00/+5130.00-0013000.00/+523000.00-0023000.00", # short latitude
+    "+513000.00-0013000.00/513000.00-0013000.00", # no sign
+    "+513000.00-0013000.00/+513000.00-0013000.00+1", # trailing junk
+    ])
+def test_parse_rejects_a_vertex_it_cannot_read(text):
+    # dropping the vertex would pair every later lat/lon up with the wrong point
+    with pytest.raises(ValueError):
+        Dms.parse(text)
+
+def test_fromKml():
+    lat, lon = Dms.fromKml(" -0.19,51.15,0 -0.18,51.16,0\n\t-0.17,51.17,0 ")
+    assert lat.tolist() == [51.15, 51.16, 51.17]
+    assert lon.tolist() == [-0.19, -0.18, -0.17]
+
+def test_fromKml_mixed_tuples():
+    # some tuples with an altitude and some without can't be reshaped in one go
+    lat, lon = Dms.fromKml("-0.19,51.15,0 -0.18,51.16 -0.17,51.17,12")
+    assert lat.tolist() == [51.15, 51.16, 51.17]
+    assert lon.tolist() == [-0.19, -0.18, -0.17]
+
+def test_formatDecimal():
+    assert Dms.formatDecimal([51.15], [-0.19], 4) == ["+51.1500-000.1900"]
+    assert Dms.formatDecimal([-5.123456], [100.00006], 4) == ["-05.1235+100.0001"]
@@ -0,0 +1,109 @@
+import re
+import pytest
+from generate import Extractor, Webscrape
+
+def search(find, name, string):
+    # Webscrape.search as it was before the Extractor replaced it
+    searchString = find + r"(?=<\/span>.*>" + name + ")"
+    return re.findall(rf"{str(searchString)}", str(string))
+
+def sd(value, name):
+    return '<span class="SD" id="ID_1234567">' + value + '</span><span class="sdParams">' + name + '</span>'
+
+ad0202 = "\n".join([
+    '<div id="EGKK-AD-2.2"><table><tbody>',
+    '<tr><td>Lat: <span class="SD" id="ID_3310402">510853N</span> Long: <span class="SD" id="ID_3310403">0001125W</span></td></tr>',
+    '<tr><td>' + sd('0.52°W', 'TAD_HP;VAL_MAG_VAR') + ' ' + sd('2020', 'TAD_HP;DATE_MAG_VAR') + '</td></tr>',
+    '<tr><td>' + sd('1.07°E', 'TAD_HP;VAL_ELEV') + '</td><td>TAD_HP;VAL_MAG_VAR</td></tr>', # name after a tag-less gap
+    '<tr><td><span>3.10°W</span></td></tr>',
+    '<tr><td>>TAD_HP;VAL_MAG_VAR</td></tr>', # name on the next line doesn't count
+    '</tbody></table></div>',
+    ])
+
+ad0212 = "\n".join([
+    '<div id="EGKK-AD-2.12"><table><tbody>',
+    '<tr><td>' + sd('08R', 'TRWY_DIRECTION;TXT_DESIG') + '</td><td>' + sd('077.91°', 'TRWY_DIRECTION;VAL_TRUE_BRG') + '</td><td>' + sd('3159', 'TRWY;VAL_LEN') + '</td></tr>',
+    '<tr><td>' + sd('26L', 'TRWY_DIRECTION;TXT_DESIG') + '</td><td>' + sd('257.93°', 'TRWY_DIRECTION;VAL_TRUE_BRG') + '</td></tr>',
+    '<tr><td>' + sd('510839.71N', 'TRWY_CLINE_POINT;GEO_LAT') + sd('0001129.99W', 'TRWY_CLINE_POINT;GEO_LONG') + sd('151', 'TRWY_CLINE_POINT;VAL_GEOID_UNDULATION') + '</td></tr>',
+    '<tr><td><span>510905.19N</span><span>0000924.50W</span>' + sd('165', 'TRWY_CLINE_POINT;VAL_GEOID_UNDULATION') + '</td></tr>',
+    '<tr><td><span>08L</span>>TRWY_DIRECTION;TXT_DESIG</td></tr>', # </span> exactly 7 characters before >name
+    '<tr><td><span>26R</span>TRWY_DIRECTION;TXT_DESIG</td></tr>', # 6 characters, the name's > is the end of the </span>
+    '</tbody></table></div>',
+    ])
+
+ad0218 = "\n".join([
+    '<div id="EGKK-AD-2.18"><table><tbody>',
+    '<tr><td>' + sd('APPROACH', 'TCALLSIGN_DETAIL') + '</td><td>' + sd('126.825', 'TFREQUENCY') + sd('118.950', 'TFREQUENCY') + '</td></tr>',
+    '<tr><td>' + sd('TOWER', 'TCALLSIGN_DETAIL') + '</td><td><span>124.225</span>>TFREQUENCY</td></tr>',
+    '<tr><td><span>GROUND</span>TCALLSIGN_DETAIL</td><td><span>121.800</span> TFREQUENCY</td></tr>',
+    '<tr><td>' + sd('DELIVERY', 'TCALLSIGN_DETAIL') + '</td></tr><tr><td><span>121.950</span></td></tr>',
+    '</tbody></table></div>',
+    ])
+
+enr021 = "\n".join([
+    '<td>' + sd('LONDON FIR', 'TAIRSPACE;TXT_NAME') + '</td>',
+    '<td>' + sd("CLACTON CTA 1", 'TAIRSPACE;TXT_NAME') + ' ' + sd('LONDON TMA 2', 'TAIRSPACE;TXT_NAME') + '</td>',
+    '<td>' + sd('550000', 'TAIRSPACE_VERTEX;GEO_LAT') + sd('N', 'TAIRSPACE_VERTEX;GEO_LAT') + ' ' + sd('0050000', 'TAIRSPACE_VERTEX;GEO_LONG') + sd('W', 'TAIRSPACE_VERTEX;GEO_LONG') + '</td>',
+    '<td>' + sd('5130001', 'TAIRSPACE_VERTEX;GEO_LAT') + sd('N', 'TAIRSPACE_VERTEX;GEO_LAT') + ' <span>0020000</span><span>E</span></td>',
+    '<td>FL <span class="SD">245</span><span class="sdParams">TAIRSPACE_LAYER;VAL_DIST_VER_UPPER</span> FL <span class="SD">195</span><span class="sdParams">TAIRSPACE_LAYER;VAL_DIST_VER_LOWER</span></td>',
+    '<td>FL <span class="SD">660</span><span class="sdParams">TAIRSPACE_VOLUME;VAL_DIST_VER_UPPER</span></td>',
+    ])
+
+enr03 = "\n".join([
+    '<tbody><tr><td>' + sd('L9', 'TEN_ROUTE_RTE;TXT_DESIG') + '</td></tr>',
+    '<tr><td>' + sd('KENET', 'TDESIGNATED_POINT;CODE_ID') + '</td><td>' + sd('OCK', 'TVOR;CODE_ID') + sd('OCK', 'TDME;CODE_ID') + '</td></tr>',
+    '<tr><td>' + sd('BIG', 'TNDB;CODE_ID') + '</td><td><span>SAM</span></td><td>' + sd('UPR01', 'TDESIGNATED_POINT;CODE_ID') + '</td></tr>',
+    '<tr><td><span>ABCDE</span>>TVOR;CODE_ID</td><td><span>FGHIJ</span>TNDB;CODE_ID</td></tr>',
+    '</tbody>',
+    ])
+
+enr04 = "\n".join([
+    '<tr class="Table-row-type-3" id="ENR-4.1-VORDME-BIG"><td>' + sd('511951N', 'TVOR;GEO_LAT') + ' ' + sd('0000205E', 'TVOR;GEO_LONG') + '</td></tr>',
+    '<tr><td><span>512000</span><span>N</span>T</td><td><span>0001000W</span>>T</td></tr>',
+    ])
+
+enr051 = "\n".join([
+    '<tr><td>' + sd('EG D001A', 'TAIRSPACE;CODE_ID') + ' ' + sd('TRAWSFYNYDD', 'TAIRSPACE;TXT_NAME') + '</td></tr>',
+    '<tr><td>' + sd('524409', 'TAIRSPACE_VERTEX;GEO_LAT') + sd('N', 'TAIRSPACE_VERTEX;GEO_LAT') + ' ' + sd('0040153', 'TAIRSPACE_VERTEX;GEO_LONG') + sd('W', 'TAIRSPACE_VERTEX;GEO_LONG') + '</td></tr>',
+    '<tr><td>' + sd('10000', 'TAIRSPACE_VOLUME;VAL_DIST_VER_UPPER') + ' ' + sd('SFC', 'TAIRSPACE_VOLUME;VAL_DIST_VER_LOWER') + '</td></tr>',
+    '<tr><td><span>EG R105</span>>TAIRSPACE;CODE_ID <span>2500</span>TAIRSPACE_VOLUME;VAL_DIST_VER_UPPER</td></tr>',
+    ])
+
+cases = [
+    ("ad0202Fields", ad0202),
+    ("ad0212Fields", ad0212),
+    ("ad0218Fields", ad0218),
+    ("enr021Fields", enr021),
+    ("enr03Fields", enr03),
+    ("enr04Fields", enr04),
+    ("enr051Fields", enr051),
+    ]
+
+def expected(extractor, html):
+    # the patterns the Extractor was built from, without the lookahead it adds
+    result = {}
+    for key, (pattern, name) in extractor.fields.items():
+        find = pattern.pattern[:-len("(?=</span>)")]
+        result[key] = search(find, name, html)
+    return result
+
+@pytest.mark.parametrize("fields, html", cases, ids=[fields for fields, html in cases])
+def test_matches_search(fields, html):
+    extractor = getattr(Webscrape, fields)
+    assert extractor.extract(html) == expected(extractor, html)
+
+@pytest.mark.parametrize("fields, html", cases, ids=[fields for fields, html in cases])
+def test_finds_something(fields, html):
+    # so a fixture that stops matching anything can't pass by both sides returning nothing
+    assert any(getattr(Webscrape, fields).extract(html).values())
+
+def test_span_boundary():
+    extractor = Extractor({'frequency': (r"([\d]{3}\.[\d]{3})", "TFREQUENCY")})
+    assert extractor.extract('<span>118.500</span>>TFREQUENCY') == {'frequency': ['118.500']} # 7 characters before the name's >
+    assert extractor.extract('<span>118.500</span>TFREQUENCY') == {'frequency': []} # 6, there is no > of its own
+    assert extractor.extract('<span>118.500</span>\n>TFREQUENCY') == {'frequency': []} # the name has to be on the same line
+
+def test_name_groups_come_from_the_last_name_on_the_line():
+    extractor = Extractor({'route': (r"([A-Z]{3,5})", "T(DESIGNATED_POINT|DME|VOR|NDB);CODE_ID")})
+    html = '<span>OCK</span>>TVOR;CODE_ID <span>OCK</span>>TDME;CODE_ID'
+    assert extractor.extract(html) == {'route': search(r"([A-Z]{3,5})", "T(DESIGNATED_POINT|DME|VOR|NDB);CODE_ID", html)} == {'route': [('OCK', 'DME'), ('OCK', 'DME')]}